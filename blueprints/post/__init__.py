@@ -1,5 +1,7 @@
 from lib.utils import http_dont_auth
 import config.settings as settings
 
-BEFORE_REQUESTS = [http_dont_auth(settings.HTTP_USERNAME, settings.HTTP_PASSWORD,
-                                  'post.index', 'post.show', 'post.comment_new')]
+BEFORE_REQUESTS = [http_dont_auth(settings.HTTP_USERNAME, settings.HTTP_PASSWORD_HASH,
+                                  'post.index', 'post.show', 'post.search', 'post.comment_new',
+                                  'post.api_index', 'post.api_show',
+                                  'post.api_comment_index', 'post.api_comment_show')]
@@ -0,0 +1,92 @@
+"""
+JSON API for posts and comments.
+
+Rows are read with Core selects over the projected columns only and turned
+into dicts with precomputed keys, no ORM objects are built. List endpoints
+use keyset pagination on ``id``; ``?format=ndjson`` streams every matching
+row as newline delimited JSON, fetched in keyset batches.
+"""
+import json
+
+from flask import request, current_app, abort, stream_with_context
+from config import db
+from lib.db import read_replica
+from lib.utils import project_columns, tuples_to_dict
+from lib.pagination import YIELD_PER, request_per_page
+from . import models
+
+_encoder = json.JSONEncoder(separators=(',', ':'),
+                            default=lambda obj: obj.isoformat() if hasattr(obj, 'isoformat') else str(obj))
+
+
+@read_replica
+def api_post_index():
+    return _list(models.Post.__table__)
+
+@read_replica
+def api_post_show(id):
+    return _one(models.Post.__table__, id)
+
+@read_replica
+def api_comment_index(post_id):
+    table = models.Comment.__table__
+    return _list(table, table.c.post_id == post_id)
+
+@read_replica
+def api_comment_show(post_id, id):
+    table = models.Comment.__table__
+    return _one(table, id, table.c.post_id == post_id)
+
+
+def _select(table, *criteria):
+    try:
+        columns = project_columns(table, request.args.get('fields'))
+    except ValueError as ex:
+        abort(_json({'errors': {'fields': [str(ex)]}}, 400))
+    stmt = db.select(columns)
+    for criterion in criteria:
+        stmt = stmt.where(criterion)
+    return stmt, [col.key for col in columns]
+
+def _one(table, id, *criteria):
+    stmt, keys = _select(table, table.c.id == id, *criteria)
+    row = db.session.execute(stmt).first()
+    if row is None:
+        abort(_json({'errors': {'base': ['Not found.']}}, 404))
+    return _json(dict(zip(keys, row)))
+
+def _list(table, *criteria):
+    stmt, keys = _select(table, *criteria)
+    after = request.args.get('after', type=int)
+    if request.args.get('format') == 'ndjson':
+        return current_app.response_class(stream_with_context(_ndjson(table, stmt, keys, after)),
+                                          mimetype='application/x-ndjson')
+    per_page = request_per_page()
+    rows = _page(table, stmt, after, per_page + 1)
+    items = tuples_to_dict(keys, rows[:per_page])
+    next_cursor = rows[per_page - 1][keys.index('id')] if len(rows) > per_page else None
+    return _json({'items': items, 'next': next_cursor})
+
+def _page(table, stmt, after, limit):
+    if after is not None:
+        stmt = stmt.where(table.c.id > after)
+    return db.session.execute(stmt.order_by(table.c.id).limit(limit)).fetchall()
+
+def _ndjson(table, stmt, keys, after):
+    # Each batch is its own short keyset query, so no server side cursor
+    # is held open for the whole (possibly slow) download.
+    batch_size = current_app.config.get('STREAM_YIELD_PER', YIELD_PER)
+    id_index = keys.index('id')
+    encode = _encoder.encode
+    while True:
+        rows = _page(table, stmt, after, batch_size)
+        if not rows:
+            break
+        yield ''.join([encode(dict(zip(keys, row))) + '\n' for row in rows])
+        if len(rows) < batch_size:
+            break
+        after = rows[-1][id_index]
+
+def _json(payload, status=200):
+    return current_app.response_class(_encoder.encode(payload), status=status,
+                                      mimetype='application/json')
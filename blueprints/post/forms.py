@@ -3,13 +3,16 @@ from wtforms import validators
 from wtforms.ext.sqlalchemy.orm import model_form
 from . import models
 
-PostForm = model_form(models.Post, models.db.session, FlaskForm, field_args={
+#: Bookkeeping columns maintained by the app, not user editable.
+EXCLUDE = ['version', 'updated_at', 'comment_count', 'last_commented_at']
+
+PostForm = model_form(models.Post, models.db.session, FlaskForm, exclude=EXCLUDE, field_args={
     'name': {'validators': [validators.Required(), validators.Length(min=5, max=20)]},
     'title': {'validators': [validators.Required(), validators.Length(min=5, max=20)]},
     'content': {'validators': [validators.Required(), validators.Length(min=5, max=200)]},
 })
 
-CommentForm = model_form(models.Comment, models.db.session, FlaskForm, field_args={
+CommentForm = model_form(models.Comment, models.db.session, FlaskForm, exclude=EXCLUDE, field_args={
     'commenter': {'validators': [validators.Required()]},
     'body': {'validators': [validators.Required()]},
 })
@@ -1,3 +1,6 @@
+from collections import Counter
+from datetime import datetime
+
 from config import db
 
 
@@ -6,20 +9,137 @@ class Post(db.Model):
     name = db.Column(db.String(80))
     title = db.Column(db.String(200))
     content = db.Column(db.Text)
+    #: Bumped on every update of the post and whenever its comments change.
+    #: Only feeds ETags, it isn't used for optimistic locking: comment
+    #: writes bump it concurrently with edits of the post.
+    version = db.Column(db.Integer, nullable=False, server_default='1',
+                        onupdate=db.text('version + 1'))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+    #: Maintained by :meth:`touch`, repaired by `flask reconcile_counters`.
+    comment_count = db.Column(db.Integer, nullable=False, server_default='0')
+    last_commented_at = db.Column(db.DateTime)
 
     def __init__(self, name, title, content):
         self.name = name
         self.title = title
         self.content = content
 
+    @classmethod
+    def touch(cls, post_id, comments=0, commented_at=None):
+        """
+        Bumps `version` and `updated_at` of post `post_id` with a SQL side
+        update in the current transaction. Used when its comments change:
+        `comments` is the number of comments added (negative if removed),
+        applied to `comment_count` in the same statement.
+
+        When comments are added, `commented_at` is the latest `updated_at`
+        among them and moves `last_commented_at` forward. When they are
+        removed `last_commented_at` is recomputed from the remaining
+        comments, which must be deleted first.
+        """
+        values = {cls.version: cls.version + 1, cls.updated_at: datetime.utcnow()}
+        if comments:
+            values[cls.comment_count] = cls.comment_count + comments
+        if comments > 0:
+            values[cls.last_commented_at] = db.case(
+                [(cls.last_commented_at > commented_at, cls.last_commented_at)],
+                else_=commented_at)
+        elif comments < 0:
+            db.session.flush()
+            values[cls.last_commented_at] = _last_commented_at(post_id)
+        cls.query.filter(cls.id == post_id).update(values, synchronize_session=False)
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     commenter = db.Column(db.String(80))
     body = db.Column(db.Text)
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'))
     post = db.relationship('Post', backref=db.backref('comments', lazy='dynamic'))
+    version = db.Column(db.Integer, nullable=False, server_default='1',
+                        onupdate=db.text('version + 1'))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # Serves the post's comments and the latest of them for `touch`.
+        db.Index('ix_comment_post_id_updated_at', 'post_id', 'updated_at'),
+    )
 
     def __init__(self, commenter, body, post_id):
         self.commenter = commenter
         self.body = body
         self.post_id = post_id
+
+
+def post_version(id):
+    """
+    `(version, updated_at)` of post `id` from a primary key lookup, without
+    loading the post. `None` if there is no such post.
+    """
+    return db.session.query(Post.version, Post.updated_at).filter(Post.id == id).first()
+
+
+def post_tag(post_id):
+    """
+    Response cache tag of every page showing post `post_id`: its show page
+    and the index pages listing it.
+    """
+    return 'post:%s' % post_id
+
+
+def insert_comments(rows):
+    """
+    Inserts the comments `rows` (dicts of column values) with one
+    ``executemany``, updates the counters of their posts and commits.
+    Returns the ids of the posts.
+    """
+    now = datetime.utcnow()
+    rows = [dict(row, updated_at=row.get('updated_at') or now) for row in rows]
+    db.session.execute(Comment.__table__.insert(), rows)
+    counts = Counter(row['post_id'] for row in rows)
+    commented_at = {}
+    for row in rows:
+        commented_at[row['post_id']] = max(row['updated_at'],
+                                           commented_at.get(row['post_id'], row['updated_at']))
+    # Same lock order in every batch.
+    for post_id, count in sorted(counts.items()):
+        Post.touch(post_id, comments=count, commented_at=commented_at[post_id])
+    db.session.commit()
+    return sorted(counts)
+
+
+def _last_commented_at(post_id):
+    return db.select([db.func.max(Comment.updated_at)]) \
+        .where(Comment.post_id == post_id).as_scalar()
+
+
+def reconcile_counters(batch_size=1000, dry_run=False):
+    """
+    Recomputes `comment_count` and `last_commented_at` of all posts,
+    `batch_size` posts per transaction, and fixes the ones that drifted.
+    Yields the ids of the posts fixed in each batch.
+    """
+    last_id = 0
+    while True:
+        posts = db.session.query(Post.id, Post.comment_count, Post.last_commented_at) \
+            .filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+        if not posts:
+            return
+        last_id = posts[-1].id
+        actual = dict((post_id, (count, last)) for post_id, count, last in
+                      db.session.query(Comment.post_id, db.func.count(Comment.id),
+                                       db.func.max(Comment.updated_at))
+                      .filter(Comment.post_id.in_([post.id for post in posts]))
+                      .group_by(Comment.post_id))
+        fixed = []
+        for post in posts:
+            count, last = actual.get(post.id, (0, None))
+            if (post.comment_count, post.last_commented_at) != (count, last):
+                fixed.append(post.id)
+                if not dry_run:
+                    Post.query.filter(Post.id == post.id).update(
+                        {Post.comment_count: count, Post.last_commented_at: last,
+                         Post.version: Post.version + 1}, synchronize_session=False)
+        db.session.commit()
+        yield fixed
@@ -0,0 +1,173 @@
+"""
+Full-text search over post titles, contents and comment bodies.
+
+The index is kept up to date by triggers on ``post`` and ``comment``, with
+one ``post_search`` row per post and one ``comment_search`` row per
+comment so that a write only touches its own row: FTS5 tables on SQLite,
+``tsvector`` columns with GIN indexes on Postgres. The DDL below runs with
+``db.create_all()``; migration 5b2d8e6f0a13 creates it on existing
+databases.
+
+A post matches when its title and content, or one of its comments, contain
+all the search terms. Results are ordered by the best rank (title matches
+weigh most, then content, then comments) and paged with a ``score:id``
+keyset cursor.
+"""
+import re
+
+from sqlalchemy import DDL, event, text
+
+from config import db
+from lib.pagination import KeysetPage
+from . import models
+
+#: Search terms beyond this are ignored.
+MAX_TERMS = 8
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE post_search USING fts5("
+    "title, content, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE VIRTUAL TABLE comment_search USING fts5("
+    "body, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER post_search_ai AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_search (rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER post_search_au AFTER UPDATE OF title, content ON post BEGIN "
+    "UPDATE post_search SET title = new.title, content = new.content WHERE rowid = new.id; END",
+    "CREATE TRIGGER post_search_ad AFTER DELETE ON post BEGIN "
+    "DELETE FROM post_search WHERE rowid = old.id; END",
+    "CREATE TRIGGER comment_search_ai AFTER INSERT ON comment BEGIN "
+    "INSERT INTO comment_search (rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER comment_search_au AFTER UPDATE OF body ON comment BEGIN "
+    "UPDATE comment_search SET body = new.body WHERE rowid = new.id; END",
+    "CREATE TRIGGER comment_search_ad AFTER DELETE ON comment BEGIN "
+    "DELETE FROM comment_search WHERE rowid = old.id; END",
+]
+
+SQLITE_DROP = [
+    "DROP TABLE IF EXISTS comment_search",
+    "DROP TABLE IF EXISTS post_search",
+]
+
+POSTGRES_DDL = [
+    "CREATE TABLE post_search ("
+    "post_id integer PRIMARY KEY REFERENCES post (id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL)",
+    "CREATE TABLE comment_search ("
+    "comment_id integer PRIMARY KEY REFERENCES comment (id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX ix_post_search_document ON post_search USING gin (document)",
+    "CREATE INDEX ix_comment_search_document ON comment_search USING gin (document)",
+    """CREATE FUNCTION post_search_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'post' THEN
+        INSERT INTO post_search (post_id, document)
+        VALUES (NEW.id, setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                        setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B'))
+        ON CONFLICT (post_id) DO UPDATE SET document = excluded.document;
+    ELSE
+        INSERT INTO comment_search (comment_id, document)
+        VALUES (NEW.id, setweight(to_tsvector('english', coalesce(NEW.body, '')), 'C'))
+        ON CONFLICT (comment_id) DO UPDATE SET document = excluded.document;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql""",
+    "CREATE TRIGGER post_search_update AFTER INSERT OR UPDATE OF title, content ON post "
+    "FOR EACH ROW EXECUTE PROCEDURE post_search_trigger()",
+    "CREATE TRIGGER comment_search_update AFTER INSERT OR UPDATE OF body ON comment "
+    "FOR EACH ROW EXECUTE PROCEDURE post_search_trigger()",
+]
+
+POSTGRES_DROP = [
+    "DROP TABLE IF EXISTS comment_search",
+    "DROP TABLE IF EXISTS post_search",
+    "DROP FUNCTION IF EXISTS post_search_trigger() CASCADE",
+]
+
+# Both tables have to exist before the triggers are created, and the search
+# tables referencing them go before either is dropped.
+for statement in SQLITE_DDL:
+    event.listen(models.Comment.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_DDL:
+    event.listen(models.Comment.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='postgresql'))
+for statement in SQLITE_DROP:
+    event.listen(models.Comment.__table__, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_DROP:
+    event.listen(models.Comment.__table__, 'before_drop',
+                 DDL(statement).execute_if(dialect='postgresql'))
+
+# Best rank of each post over its own row and its comments' rows.
+_RANKED_SQL = """SELECT post_id, score FROM (
+    SELECT post_id, max(score) AS score FROM (%s) AS matches GROUP BY post_id) AS ranked"""
+_SEARCH_SQL = {
+    'sqlite': _RANKED_SQL % """
+        SELECT rowid AS post_id, -bm25(post_search, 10.0, 5.0) AS score
+        FROM post_search WHERE post_search MATCH :query
+        UNION ALL
+        SELECT comment.post_id, -bm25(comment_search) AS score
+        FROM comment_search JOIN comment ON comment.id = comment_search.rowid
+        WHERE comment_search MATCH :query""",
+    'postgresql': _RANKED_SQL % """
+        SELECT post_id, ts_rank_cd(document, query)::float8 AS score
+        FROM post_search, to_tsquery('english', :query) AS query
+        WHERE document @@ query
+        UNION ALL
+        SELECT comment.post_id, ts_rank_cd(document, query)::float8 AS score
+        FROM comment_search JOIN comment ON comment.id = comment_search.comment_id,
+             to_tsquery('english', :query) AS query
+        WHERE document @@ query""",
+}
+# Postgres ranks are ``real``: the score is cast to ``float8`` so that the
+# cursor, which carries it as a Python float, compares equal to it.
+_AFTER_SQL = " WHERE score < :score OR (score = :score AND post_id > :post_id)"
+_ORDER_SQL = " ORDER BY score DESC, post_id LIMIT :limit"
+
+
+def parse_query(q, dialect):
+    """
+    Match expression for `q` in `dialect`: all of its words, each of them
+    as a prefix. `None` if `q` has no words.
+    """
+    terms = re.findall(r'\w+', q, re.UNICODE)[:MAX_TERMS]
+    if not terms:
+        return None
+    if dialect == 'postgresql':
+        return ' & '.join('%s:*' % term for term in terms)
+    return ' '.join('"%s"*' % term for term in terms)
+
+
+def parse_cursor(cursor):
+    """
+    `(score, post_id)` from a ``score:id`` cursor, `None` if it is invalid.
+    """
+    score, _, post_id = (cursor or '').rpartition(':')
+    try:
+        return float(score), int(post_id)
+    except ValueError:
+        return None
+
+
+def search_posts(q, after=None, per_page=20):
+    """
+    A :class:`KeysetPage` of the posts matching `q`, best first. `after` is
+    the `next_cursor` of the previous page.
+    """
+    dialect = db.session.get_bind().dialect.name
+    query = parse_query(q, dialect)
+    if query is None or dialect not in _SEARCH_SQL:
+        return KeysetPage([], per_page)
+    sql = _SEARCH_SQL[dialect]
+    params = {'query': query, 'limit': per_page + 1}
+    cursor = parse_cursor(after)
+    if cursor is not None:
+        sql += _AFTER_SQL
+        params['score'], params['post_id'] = cursor
+    rows = db.session.execute(text(sql + _ORDER_SQL), params).fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = dict((post.id, post) for post in
+                 models.Post.query.filter(models.Post.id.in_([row[0] for row in rows])))
+    items = [posts[row[0]] for row in rows if row[0] in posts]
+    next_cursor = '%r:%d' % (rows[-1][1], rows[-1][0]) if more else None
+    return KeysetPage(items, per_page, next_cursor)
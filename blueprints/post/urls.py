@@ -1,12 +1,20 @@
-from . import views
+from . import views, api
 
+# Add `'stream': True` to a listing route's opts to stream its template,
+# eg. ('/', 'index', views.post_index, {'stream': True}).
 routes = [
     ('/', 'index', views.post_index),
     ('/<int:id>', 'show', views.post_show),
+    ('/search', 'search', views.post_search),
     ('/new', 'new', views.post_new, {'methods': ['GET', 'POST']}),
     ('/<int:id>/edit', 'edit', views.post_edit, {'methods': ['GET', 'POST']}),
     ('/<int:id>/delete', 'delete', views.post_delete, {'methods': ['POST', 'DELETE']}),
 
     ('/<int:post_id>/comment_new', 'comment_new', views.comment_new, {'methods': ['GET', 'POST']}),
     ('/<int:post_id>/comment_delete/<int:id>', 'comment_delete', views.comment_delete, {'methods': ['GET', 'POST']}),
+
+    ('/api', 'api_index', api.api_post_index),
+    ('/api/<int:id>', 'api_show', api.api_post_show),
+    ('/api/<int:post_id>/comments', 'api_comment_index', api.api_comment_index),
+    ('/api/<int:post_id>/comments/<int:id>', 'api_comment_show', api.api_comment_show),
 ]
@@ -1,16 +1,40 @@
-from flask import render_template, redirect, url_for, request
+from datetime import datetime
+from functools import partial
+
+from flask import render_template, redirect, url_for, request, current_app, abort
 from config import db
-from . import models, forms
+from lib.db import read_replica, stick_to_primary
+from lib.group_commit import GroupCommitter, GroupCommitTimeout
+from lib.pagination import paginate_request, request_per_page
+from lib.response_cache import cache_response, tag_response, invalidate
+from lib.conditional import conditional_response
+from lib.streaming import render_listing
+from . import models, forms, search
 
 
+@read_replica
+@cache_response(tags=['post-list'])
 def post_index():
-    object_list = models.Post.query.all()
-    return render_template('post/index.jinja2', object_list=object_list)
+    def on_batch(posts):
+        tag_response(*[models.post_tag(post.id) for post in posts])
+    page = paginate_request(models.Post.query, models.Post.id, on_batch=on_batch)
+    return render_listing('post/index.jinja2', object_list=page, page=page)
 
+@read_replica
+@conditional_response(models.post_version)
+@cache_response(tags=lambda id: [models.post_tag(id)], vary_session=True)
 def post_show(id):
-    post = models.Post.query.get(id)
+    post = models.Post.query.get_or_404(id)
     form = forms.CommentForm()
-    return render_template('post/show.jinja2', post=post, form=form)
+    return _render_show(post, form)
+
+@read_replica
+def post_search():
+    q = request.args.get('q', '').strip()
+    page = None
+    if q:
+        page = search.search_posts(q, after=request.args.get('after'), per_page=request_per_page())
+    return render_template('post/search.jinja2', q=q, page=page)
 
 def post_new():
     form = forms.PostForm()
@@ -18,6 +42,7 @@ def post_new():
         post = models.Post(form.name.data, form.title.data, form.content.data)
         db.session.add(post)
         db.session.commit()
+        invalidate('post-list')
         return redirect(url_for('post.index'))
     return render_template('post/new.jinja2', form=form)
 
@@ -30,6 +55,7 @@ def post_edit(id):
         post.content = form.content.data
         db.session.add(post)
         db.session.commit()
+        invalidate(models.post_tag(id))
         return redirect(url_for('post.show', id=id))
     return render_template('post/edit.jinja2', form=form, post=post)
 
@@ -37,20 +63,57 @@ def post_delete(id):
     post = models.Post.query.get(id)
     db.session.delete(post)
     db.session.commit()
+    invalidate('post-list', models.post_tag(id))
     return redirect(url_for('post.index'))
 
 def comment_new(post_id):
-    post = models.Post.query.get(post_id)
+    post = models.Post.query.get_or_404(post_id)
     form = forms.CommentForm()
     if form.validate_on_submit():
+        if current_app.config.get('COMMENT_GROUP_COMMIT'):
+            row = dict(commenter=form.commenter.data, body=form.body.data, post_id=post_id)
+            try:
+                _comment_writer().submit(row, timeout=current_app.config.get('GROUP_COMMIT_TIMEOUT'))
+            except GroupCommitTimeout:
+                abort(503)
+            stick_to_primary(current_app)
+            invalidate(models.post_tag(post_id))
+            return redirect(url_for('.show', id=post_id))
         comment = models.Comment(form.commenter.data, form.body.data, post_id)
+        comment.updated_at = datetime.utcnow()
         db.session.add(comment)
+        models.Post.touch(post_id, comments=1, commented_at=comment.updated_at)
         db.session.commit()
+        invalidate(models.post_tag(post_id))
         return redirect(url_for('.show', id=post_id))
-    return render_template('post/show.jinja2', post=post, form=form)
+    return _render_show(post, form)
 
 def comment_delete(post_id, id):
-    comment = models.Comment.query.get(id)
+    comment = models.Comment.query.filter_by(id=id, post_id=post_id).first_or_404()
     db.session.delete(comment)
+    models.Post.touch(post_id, comments=-1)
     db.session.commit()
+    invalidate(models.post_tag(post_id))
     return redirect(url_for('.show', id=post_id))
+
+def _render_show(post, form):
+    # `post.comments` is a dynamic relationship; fetch one ordered, bounded
+    # page of it here so the template doesn't issue its own query.
+    comments = paginate_request(post.comments, models.Comment.id, with_total=False)
+    return render_template('post/show.jinja2', post=post, form=form, comments=comments)
+
+_comment_committer = None
+
+def _comment_writer():
+    global _comment_committer
+    if _comment_committer is None:
+        app = current_app._get_current_object()
+        _comment_committer = GroupCommitter(partial(_flush_comments, app),
+                                            max_batch=app.config.get('GROUP_COMMIT_MAX_BATCH', 100),
+                                            max_delay=app.config.get('GROUP_COMMIT_MAX_DELAY', 0.005),
+                                            name='comment_group_commit')
+    return _comment_committer
+
+def _flush_comments(app, rows):
+    with app.app_context():
+        models.insert_comments(rows)
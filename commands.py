@@ -2,6 +2,7 @@ import os, signal, sys
 import subprocess as sp
 import werkzeug.serving
 import click
+import sqlalchemy
 from werkzeug import import_string
 
 
@@ -31,6 +32,26 @@ def run_gevent(port=5000):
     _runner(runner, port)
 
 
+@app.cli.command()
+@click.option('--port', '-p', default=5000)
+@click.option('--workers', '-w', default=None, type=int, help='Defaults to the number of CPUs.')
+@click.option('--engine', '-e', type=click.Choice(['gevent', 'tornado']), default='gevent')
+@click.option('--backlog', default=2048)
+@click.option('--graceful-timeout', default=None, type=int,
+              help='Seconds a stopping worker gets to finish. Defaults to GRACEFUL_TIMEOUT.')
+def run_prefork(port=5000, workers=None, engine='gevent', backlog=2048, graceful_timeout=None):
+    """
+    Runs the app in several worker processes sharing the port.
+
+    \b
+    Workers listen on their own SO_REUSEPORT sockets. Dead workers are
+    restarted, SIGHUP replaces the workers one at a time and SIGTERM or
+    SIGINT stops them gracefully.
+    """
+    import script.prefork as prefork
+    prefork.run(app, engine, port, workers, backlog, graceful_timeout)
+
+
 def _runner(runner, *args, **kwargs):
     environ = os.environ.get('FLASK_ENV')
     if not environ or environ != 'prod':
@@ -80,6 +101,212 @@ def db_dropall():
     db.drop_all()
 
 
+@app.cli.command()
+@click.argument('table_name')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', '-f', 'fmt', type=click.Choice(['ndjson', 'csv']), default=None,
+              help='Input format. Guessed from the file extension by default.')
+@click.option('--chunk-size', '-c', default=5000, help='Rows inserted per transaction.')
+@click.option('--resume/--no-resume', default=True,
+              help='Skip rows already imported by a previous, interrupted run.')
+def db_import(table_name, path, fmt=None, chunk_size=5000, resume=True):
+    """
+    Bulk loads rows into a table from a NDJSON or CSV file.
+
+    \b
+    Rows are inserted in chunks, one transaction per chunk, using COPY on
+    Postgres and executemany elsewhere. The number of rows imported is
+    recorded in the `import_progress` table in each chunk's transaction, so
+    an interrupted import resumes after the last committed chunk. Importing
+    posts expires the cached index pages, importing comments ends with
+    `reconcile_counters`.
+
+    \b
+    Eg.
+        flask db_import post posts.ndjson -c 10000
+        flask db_import comment comments.csv
+    """
+    import_string('models', silent=True)
+    for blueprint_name, blueprint in app.blueprints.items():
+        import_string('%s.models' % blueprint.import_name, silent=True)
+    table = db.metadata.tables.get(table_name)
+    if table is None:
+        raise click.BadParameter('No such table: %s' % table_name)
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+
+    engine = db.get_engine(app)
+    progress = _import_progress.c
+    source = '%s:%s' % (table_name, os.path.abspath(path))
+    _import_progress.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        done = conn.execute(db.select([progress.done]).where(progress.source == source)).scalar()
+        if done is None:
+            done = 0
+            conn.execute(_import_progress.insert(), source=source, done=0)
+        elif not resume:
+            done = 0
+    if done:
+        click.echo('Resuming after %s rows.' % done)
+    record_progress = _import_progress.update().where(progress.source == source)
+
+    insert_chunk = _copy_chunk if engine.dialect.name == 'postgresql' else _executemany_chunk
+    defaults = _python_defaults(table)
+    parsers = _column_parsers(table)
+    with open(path) as in_file:
+        records = _read_records(in_file, fmt)
+        for _ in range(done):
+            next(records, None)
+        with engine.connect() as conn:
+            if engine.dialect.name == 'sqlite':
+                # Seeding a dev db: durability of every chunk isn't needed.
+                conn.execute('PRAGMA synchronous = OFF')
+            while True:
+                chunk = _chunk_rows(records, table, defaults, parsers, chunk_size)
+                if not chunk:
+                    break
+                with conn.begin():
+                    insert_chunk(conn, table, chunk)
+                    conn.execute(record_progress, done=done + len(chunk))
+                done += len(chunk)
+                click.echo('%s rows imported.' % done)
+    if engine.dialect.name == 'postgresql' and 'id' in table.c:
+        # Rows carrying explicit ids leave the sequence behind.
+        with engine.begin() as conn:
+            conn.execute("SELECT setval(pg_get_serial_sequence('%s', 'id'), "
+                         "COALESCE((SELECT MAX(id) FROM %s), 1))" % (table.name, table.name))
+    with engine.begin() as conn:
+        conn.execute(_import_progress.delete().where(progress.source == source))
+    if table_name == 'post':
+        from lib.response_cache import invalidate
+        invalidate('post-list')
+    elif table_name == 'comment':
+        # Rows were inserted without updating the posts' counters.
+        click.get_current_context().invoke(reconcile_counters)
+    click.echo('Done.')
+
+
+#: Rows imported so far by `db_import`, per table and file. Kept out of
+#: the models' metadata: it's created on first use and not migrated.
+_import_progress = sqlalchemy.Table('import_progress', sqlalchemy.MetaData(),
+                                    sqlalchemy.Column('source', sqlalchemy.String(1024),
+                                                      primary_key=True),
+                                    sqlalchemy.Column('done', sqlalchemy.Integer, nullable=False))
+
+
+def _read_records(in_file, fmt):
+    import csv, json
+    if fmt == 'csv':
+        for record in csv.DictReader(in_file):
+            yield dict((k, v if v != '' else None) for k, v in record.items())
+    else:
+        for line in in_file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _python_defaults(table):
+    # Core applies these for executemany but COPY bypasses them.
+    defaults = {}
+    for col in table.columns:
+        if col.default is not None and not col.primary_key:
+            if col.default.is_callable:
+                defaults[col.key] = lambda arg=col.default.arg: arg(None)
+            elif col.default.is_scalar:
+                defaults[col.key] = lambda arg=col.default.arg: arg
+    return defaults
+
+
+def _column_parsers(table):
+    # CSV gives strings for every column, JSON for dates and times.
+    import datetime
+    parsers = {}
+    for col in table.columns:
+        try:
+            python_type = col.type.python_type
+        except NotImplementedError:
+            continue
+        if python_type is datetime.datetime:
+            parsers[col.key] = _parse_datetime
+        elif python_type is datetime.date:
+            parsers[col.key] = lambda value: datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        elif python_type is bool:
+            parsers[col.key] = lambda value: value.lower() in ('1', 'true', 't', 'yes')
+        elif python_type in (int, float):
+            parsers[col.key] = python_type
+    return parsers
+
+
+def _parse_datetime(value):
+    # `isoformat()` output, as written by the JSON API, or with a space.
+    import datetime
+    value = value.replace(' ', 'T', 1)
+    fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S'
+    return datetime.datetime.strptime(value, fmt)
+
+
+def _chunk_rows(records, table, defaults, parsers, chunk_size):
+    keys = table.columns.keys()
+    chunk = []
+    for record in records:
+        row = dict((k, record[k]) for k in keys if k in record)
+        for k, parse in parsers.items():
+            if isinstance(row.get(k), str):
+                try:
+                    row[k] = parse(row[k])
+                except ValueError:
+                    raise click.ClickException('Invalid %s value: %r' % (k, row[k]))
+        for k, default in defaults.items():
+            if row.get(k) is None:
+                row[k] = default()
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            break
+    if chunk:
+        # Every row of an executemany/COPY needs the same columns.
+        columns = set().union(*chunk)
+        for row in chunk:
+            for k in columns.difference(row):
+                row[k] = None
+    return chunk
+
+
+def _executemany_chunk(conn, table, chunk):
+    conn.execute(table.insert(), chunk)
+
+
+def _copy_chunk(conn, table, chunk):
+    import csv, io
+    columns = sorted(chunk[0])
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in chunk:
+        writer.writerow(['\\N' if row[k] is None else row[k] for k in columns])
+    buf.seek(0)
+    cursor = conn.connection.cursor()
+    cursor.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+                       % (table.name, ', '.join(columns)), buf)
+
+
+@app.cli.command()
+@click.option('--batch-size', '-b', default=1000)
+@click.option('--dry-run', is_flag=True, help='Only report the posts that drifted.')
+def reconcile_counters(batch_size=1000, dry_run=False):
+    """
+    Repairs the comment counters of posts in batches.
+    """
+    from blueprints.post import models
+    from lib.response_cache import invalidate
+    total = 0
+    for fixed in models.reconcile_counters(batch_size, dry_run):
+        total += len(fixed)
+        if fixed and not dry_run:
+            invalidate('post-list', *[models.post_tag(post_id) for post_id in fixed])
+        for post_id in fixed:
+            click.echo('Post %s drifted.' % post_id)
+    click.echo('%s posts %s.' % (total, 'drifted' if dry_run else 'fixed'))
+
+
 @app.cli.command()
 @click.argument('name')
 @click.option('--scaffold', '-s', is_flag=True, default=False)
@@ -337,13 +564,18 @@ def create_view(name, fields=''):
 
 create_view.imports = '''from flask import render_template, redirect, url_for, flash, request
 from config import db
+from lib.db import read_replica
+from lib.pagination import paginate_request
+from lib.streaming import render_listing
 from . import models, forms
 '''
 create_view.views_scaffold = '''
+@read_replica
 def %(name)s_index():
-    object_list = models.%(model_name)s.query.all()
-    return render_template('%(name)s/index.jinja2', object_list=object_list)
+    page = paginate_request(models.%(model_name)s.query, models.%(model_name)s.id)
+    return render_listing('%(name)s/index.jinja2', object_list=page, page=page)
 
+@read_replica
 def %(name)s_show(id):
     %(name)s = models.%(model_name)s.query.get(id)
     return render_template('%(name)s/show.jinja2', %(name)s=%(name)s)
@@ -446,6 +678,7 @@ create_templates.form_scaffold = '''{% from 'helpers.jinja2' import render_field
 create_templates.form_field = '''
   {{ render_field(form.%(field_name)s) }}'''
 create_templates.index_scaffold = '''{% extends 'layout.jinja2' %}
+{% from 'helpers.jinja2' import render_pagination %}
 {% block content %}
   <table>
     <thead>
@@ -473,6 +706,7 @@ create_templates.index_scaffold = '''{% extends 'layout.jinja2' %}
       {% endfor %}
     </tbody>
   </table>
+  {{ render_pagination(page) }}
   <a  href="{{ url_for('.new') }}">New %(name)s</a>
 {% endblock %}
 '''
@@ -524,6 +758,127 @@ def create_scaffold(name, fields=''):
     create_routes(name)
 
 
+@app.cli.command()
+@click.password_option()
+def hash_password(password):
+    """
+    Prints the bcrypt hash of a password, eg. for `HTTP_PASSWORD_HASH`.
+    """
+    from config import bcrypt
+    click.echo(bcrypt.generate_password_hash(password).decode('utf-8'))
+
+
+@app.cli.command()
+@click.option('--workers', '-w', default=None, type=int,
+              help='Build processes. Defaults to the number of bundles.')
+def assets_build(workers=None):
+    """
+    Builds all asset bundles in parallel processes.
+
+    \b
+    Output files get the hash of their contents in their names and a JSON
+    manifest mapping each bundle to its hash is written to `ASSETS_MANIFEST`.
+    With `ASSETS_AUTO_BUILD = False` templates resolve bundle urls from the
+    manifest without touching the filesystem.
+    """
+    import json, multiprocessing
+    from webassets.version import JsonManifest
+    from lib.static import compress_file
+    import main
+    env = app.jinja_env.assets_environment
+    main.register_bundles(env)
+    names = sorted(main.load_bundles())
+    pool = multiprocessing.Pool(workers or len(names))
+    try:
+        built = pool.map(_build_bundle, names)
+    finally:
+        pool.close()
+        pool.join()
+    manifest = env.manifest
+    if not isinstance(manifest, JsonManifest):
+        raise click.ClickException('ASSETS_MANIFEST must be a "json:" manifest.')
+    # Same format as `JsonManifest`: bundle output pattern -> version.
+    versions = {}
+    if os.path.exists(manifest.filename):
+        with open(manifest.filename) as f:
+            versions = json.load(f)
+    versions.update((output, version) for name, output, version, path in built)
+    with open(manifest.filename + '.tmp', 'w') as f:
+        json.dump(versions, f, indent=4, sort_keys=True)
+    os.rename(manifest.filename + '.tmp', manifest.filename)
+    for name, output, version, path in built:
+        click.echo('%-12s %s' % (name, output % {'version': version}))
+        for compressed in compress_file(path):
+            click.echo('%-12s %s' % ('', os.path.relpath(compressed, env.directory)))
+    click.echo('Manifest written to %s' % manifest.filename)
+
+
+def _build_bundle(name):
+    # Runs in a pool process. The manifest is written once by the parent,
+    # since processes would overwrite each other's entries.
+    env = app.jinja_env.assets_environment
+    env.manifest = False
+    with app.app_context():
+        bundle = env[name]
+        bundle.build(force=True)
+        path = bundle.resolve_output()
+    return name, bundle.output, bundle.version, path
+
+
+@app.cli.command()
+@click.option('--min-size', default=1024, help='Smallest file size to compress, in bytes.')
+def static_compress(min_size=1024):
+    """
+    Writes .gz (and .br, with the brotli package) versions of the compressible
+    files in the app's and blueprints' static folders, for serving without
+    compressing per request.
+    """
+    from lib.static import compress_tree
+    folders = [app.static_folder] + [bp.static_folder for bp in app.blueprints.values()]
+    for folder in folders:
+        if folder and os.path.isdir(folder):
+            for path in compress_tree(folder, min_size):
+                click.echo(os.path.relpath(path))
+
+
+@app.cli.command()
+def templates_compile():
+    """
+    Compiles all templates into the bytecode cache, ahead of deploy.
+    """
+    import time
+    import main
+    cache = app.jinja_env.bytecode_cache
+    if cache is None:
+        raise click.ClickException('JINJA_BYTECODE_CACHE_DIR is not set.')
+    cache.clear()
+    # Templates already loaded by this process would skip the cache.
+    app.jinja_env.cache.clear()
+    start = time.time()
+    names = app.jinja_env.list_templates(extensions=app.config.get('TEMPLATES_EXTENSIONS'))
+    failed = main.preload_templates(app)
+    click.echo('Compiled %s templates in %.1f ms into %s.'
+               % (len(names) - len(failed), (time.time() - start) * 1000, cache.directory))
+    if failed:
+        raise click.ClickException('Failed to compile: %s' % ', '.join(failed))
+
+
+@app.cli.command()
+def startup_profile():
+    """
+    Reports the time taken by each app initialization step, imports included,
+    measured in a fresh interpreter.
+    """
+    import json
+    out = sp.check_output([sys.executable, '-c',
+                           'import time, json; start = time.time(); import main; '
+                           'print(json.dumps([main.app.startup_timings, time.time() - start]))'])
+    timings, total = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+    for name, seconds in timings:
+        print('%-28s %8.1f ms' % (name, seconds * 1000))
+    print('%-28s %8.1f ms' % ('total (import main)', total * 1000))
+
+
 @app.cli.command()
 def ipython():
     """IPython shell"""
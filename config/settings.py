@@ -7,7 +7,9 @@ import sys
 import os
 import logging
 import importlib
-from lib.middlewares import MethodRewriteMiddleware
+import tempfile
+from lib.middlewares import MethodRewriteMiddleware, MetricsMiddleware, CompressionMiddleware
+from lib.utils import immutable_assets
 from flask import render_template
 
 from .blueprints import *
@@ -26,7 +28,18 @@ BEFORE_REQUESTS = [
 ]
 
 #: After request middlewares.
-AFTER_REQUESTS = []
+AFTER_REQUESTS = [immutable_assets]
+
+#: Create rarely used extensions (cache, bcrypt) on first use and load
+#: `assets.yml` on the first request instead of at worker boot.
+LAZY_STARTUP = False
+
+#: webassets settings. Built bundles get the hash of their contents in the
+#: file name; `flask assets_build` records the names in the manifest.
+ASSETS_VERSIONS = 'hash'
+ASSETS_MANIFEST = 'json:dist/manifest.json'
+#: Seconds hashed bundles under `static/dist` may be cached by clients.
+ASSETS_MAX_AGE = 365 * 24 * 60 * 60
 
 #: Middlewares to enable.
 #: Middlewares are executed in the order specified.
@@ -35,8 +48,23 @@ MIDDLEWARES = [
     #: support REST.
     # (middleware, *args, **kwargs)
     MethodRewriteMiddleware,
+    #: Compress html, json, js and css responses on the fly.
+    CompressionMiddleware,
+    #: Per endpoint request metrics, served on `/_metrics`.
+    MetricsMiddleware,
 ]
 
+#: `CompressionMiddleware` settings. Responses below `COMPRESS_MIN_SIZE`
+#: bytes are sent as is.
+COMPRESS_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 4
+COMPRESS_MIN_SIZE = 1024
+
+#: Directory the per process metrics files are written to. It is shared by
+#: all workers of a server and should be emptied when the server restarts.
+#: Like `JINJA_BYTECODE_CACHE_DIR` it must belong to the app's user.
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'flask-metrics-%s' % os.getuid())
+
 stream_logger = logging.StreamHandler()
 stream_logger.setFormatter(logging.Formatter('''
                                              Message type:       %(levelname)s
@@ -54,10 +82,24 @@ stream_logger.setLevel(logging.DEBUG)
 #: Custom log handlers.
 LOG_HANDLERS = [stream_logger]
 
+#: Compiled templates are cached here, see `flask templates_compile`.
+#: None disables the cache. Code is loaded from it: it must be owned by
+#: the app's user and not writable by others, and is created with mode 0700.
+JINJA_BYTECODE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'flask-jinja-cache-%s' % os.getuid())
+#: Load all templates at startup, from the bytecode cache when possible.
+TEMPLATES_PRELOAD = False
+#: File extensions of the templates to preload and compile.
+TEMPLATES_EXTENSIONS = ['jinja2', 'html']
+
 #: Jinja2 filters.
 # TEMPLATE_FILTERS = [('custom_reverse', lambda x: x[::-1])]
 TEMPLATE_FILTERS = []
 
+#: Jinja2 extensions. `{% cache key, timeout %}` caches template fragments.
+JINJA_EXTENSIONS = ['lib.template_cache.FragmentCacheExtension']
+#: Default timeout of `{% cache %}` fragments.
+FRAGMENT_CACHE_TIMEOUT = 300
+
 #: Jinja2 context processors.
 # CONTEXT_PROCESSORS = {name: val}
 CONTEXT_PROCESSORS = {
@@ -66,8 +108,73 @@ CONTEXT_PROCESSORS = {
 #: Error handlers for http and other arbitrary exceptions.
 ERROR_HANDLERS = [(404, lambda error: (render_template('errors/not_found.jinja2'), 404))]
 
+#: Options for `create_engine`, eg. pool sizing; see `prod_settings`.
+SQLALCHEMY_ENGINE_OPTIONS = {}
+#: Connections to open when a worker starts, see `lib.db.warm_up`.
+DB_POOL_WARMUP = 0
+
+#: Threads running requests under tornado. With 0 requests run on the
+#: IOLoop itself. `TORNADO_QUEUE_SIZE` requests may wait for a thread,
+#: more get a 503.
+TORNADO_THREADS = 0
+TORNADO_QUEUE_SIZE = 64
+
+#: Concurrent requests per gevent worker. None sizes the greenlet pool
+#: to the DB pool (`pool_size + max_overflow`).
+GEVENT_POOL_SIZE = None
+#: Seconds an idle keep-alive connection is kept open by gevent.
+GEVENT_KEEPALIVE_TIMEOUT = 5
+#: Listen backlog when the gevent runner binds its own socket.
+GEVENT_BACKLOG = 2048
+#: Log greenlets that block the gevent hub for longer than this many
+#: seconds. None disables the check.
+GEVENT_MAX_BLOCKING_TIME = None
+
+#: Read replicas of `SQLALCHEMY_DATABASE_URI`. Views decorated with
+#: `lib.db.read_replica` query one of them.
+SQLALCHEMY_REPLICA_URIS = []
+#: Seconds a client keeps reading from the primary after a write, so it
+#: sees what it wrote despite replication lag.
+DB_STICKY_PRIMARY_SECONDS = 5
+
+#: Write comments through a per-worker group committer: a background
+#: thread commits them in batches of up to `GROUP_COMMIT_MAX_BATCH`,
+#: waiting at most `GROUP_COMMIT_MAX_DELAY` seconds to fill one. Requests
+#: wait up to `GROUP_COMMIT_TIMEOUT` seconds for their batch, then get a 503.
+COMMENT_GROUP_COMMIT = False
+GROUP_COMMIT_MAX_BATCH = 100
+GROUP_COMMIT_MAX_DELAY = 0.005
+GROUP_COMMIT_TIMEOUT = 5
+
+#: Seconds a stopping server waits for running requests.
+GRACEFUL_TIMEOUT = 30
+
+#: Keyset pagination defaults for listing views. `per_page` from the
+#: query string is clamped to `PAGINATION_MAX_PER_PAGE`.
+PAGINATION_PER_PAGE = 20
+PAGINATION_MAX_PER_PAGE = 100
+
+#: Listing routes marked `'stream': True` use these instead. Rows are read
+#: from the DB `STREAM_YIELD_PER` at a time and the template is flushed
+#: every `STREAM_BUFFER_SIZE` template chunks.
+STREAM_PER_PAGE = 1000
+STREAM_MAX_PER_PAGE = 10000
+STREAM_YIELD_PER = 500
+STREAM_BUFFER_SIZE = 20
+
+#: Seconds a full page response cached with
+#: `lib.response_cache.cache_response` is kept. Pages embedding a CSRF
+#: token must not outlive `WTF_CSRF_TIME_LIMIT`.
+RESPONSE_CACHE_TIMEOUT = 300
+
+#: HTTP basic auth credentials. Generate the hash with `flask hash_password`.
+#: The default hash is for 'password'.
 HTTP_USERNAME = 'admin'
-HTTP_PASSWORD = 'password'
+HTTP_PASSWORD_HASH = '$2b$12$/Hp0M3VTuTNInKt7M5MOcuetRemveatQu9s0OEBh3hR56doRURuHO'
+#: Successful basic auth checks are remembered for `HTTP_AUTH_CACHE_TTL`
+#: seconds, for at most `HTTP_AUTH_CACHE_SIZE` distinct credentials.
+HTTP_AUTH_CACHE_SIZE = 1024
+HTTP_AUTH_CACHE_TTL = 300
 
 # Load appropriate settings.
 environ = os.environ.get('FLASK_ENV')
@@ -0,0 +1,21 @@
+import os
+import tempfile
+
+DEBUG = False
+TESTING = True
+
+#: Database the test suite creates its tables in.
+SQLALCHEMY_DATABASE_URI = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(), 'flask-test.db')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+#: Tests post forms directly.
+WTF_CSRF_ENABLED = False
+
+#: Nothing is cached between requests, every request reaches the views.
+CACHE_TYPE = 'null'
+CACHE_NO_NULL_WARNING = True
+JINJA_BYTECODE_CACHE_DIR = None
+#: Kept apart from the metrics of any server run by the same user.
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'flask-test-metrics-%s' % os.getuid())
+
+ASSETS_DEBUG = True
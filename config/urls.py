@@ -2,6 +2,7 @@
 Sets the mapping between `url_endpoints` and `view functions`.
 """
 from lib.utils import set_trace
+from lib.streaming import streamed
 
 routes = [
     # Define non-blueprint rotues here. Blueprint routes should be in
@@ -12,10 +13,16 @@ routes = [
 def set_urls(app, routes=routes):
     """
     Connects url patterns to actions for the given wsgi `app`.
+
+    Besides the `add_url_rule` options, `opts` can have ``'stream': True``
+    to render the view's listing templates in streaming mode.
     """
     for rule in routes:
         # Set url rule.
         url_rule, endpoint, view_func, opts = parse_url_rule(rule)
+        opts = dict(opts)
+        if opts.pop('stream', False):
+            view_func = streamed(view_func)
         app.add_url_rule(url_rule, endpoint=endpoint, view_func=view_func, **opts)
 
 
@@ -0,0 +1,63 @@
+"""
+Conditional ``GET`` support for views whose output is determined by a row version.
+"""
+import hashlib
+from functools import wraps
+
+from flask import request, session, current_app
+
+
+def conditional_response(version):
+    """
+    Answers ``If-None-Match``/``If-Modified-Since`` with a ``304`` before the
+    decorated view runs. `version` takes the view kwargs and returns a
+    ``(version, updated_at)`` pair for the underlying row, or `None` when it
+    doesn't exist, in which case the view is called as usual.
+
+    The ETag also covers the endpoint, view args, query string and the
+    session's CSRF token, since those change the rendered page as well.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return fn(*args, **kwargs)
+            current = version(**kwargs)
+            if current is None:
+                return fn(*args, **kwargs)
+            row_version, updated_at = current
+            etag = _etag(row_version)
+            if _not_modified(etag, updated_at):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if updated_at is not None:
+                response.last_modified = updated_at
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+def _etag(row_version):
+    args = sorted(request.args.items(multi=True))
+    view_args = sorted((request.view_args or {}).items())
+    raw = '%s:%r:%r:%s:%s' % (request.endpoint, view_args, args, row_version,
+                              session.get('csrf_token', ''))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _not_modified(etag, updated_at):
+    # `If-None-Match` takes precedence over `If-Modified-Since` and uses the
+    # weak comparison (RFC 7232), so tags weakened by compression still match.
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    if since is not None and updated_at is not None:
+        if since.tzinfo is not None:
+            since = since.replace(tzinfo=None)
+        return updated_at.replace(microsecond=0) <= since
+    return False
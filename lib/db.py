@@ -0,0 +1,215 @@
+"""
+Connection pool instrumentation, warm-up and read replica routing.
+
+Pool metrics go to the :mod:`lib.metrics` registry, labelled with the
+engine's bind (``default`` for the primary, see :func:`instrument_engine`):
+
+- ``db_pool_checkout_wait_seconds``: time spent waiting for a connection.
+- ``db_pool_checked_out`` / ``db_pool_overflow``: connections in use and
+  overflow connections open, summed over live workers.
+
+The first three need the engine to use :class:`InstrumentedQueuePool`.
+- ``db_pool_checkouts_total`` / ``db_pool_connects_total``: checkouts and
+  new DBAPI connections.
+
+Replicas listed in `SQLALCHEMY_REPLICA_URIS` are registered as binds
+``replica_0``, ``replica_1``... Views decorated with :func:`read_replica`
+read from one of them, unless the client wrote less than
+`DB_STICKY_PRIMARY_SECONDS` ago, so it still sees its own writes.
+"""
+import random
+import time
+from functools import wraps
+
+from flask import g, session, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+from lib.metrics import get_registry
+
+#: Session key holding the time until which the client reads from the primary.
+STICKY_KEY = '_db_primary_until'
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    `QueuePool` recording how long each checkout waited for a connection
+    and the number of connections checked out and in overflow.
+    """
+    def _do_get(self):
+        start = time.time()
+        try:
+            return super(InstrumentedQueuePool, self)._do_get()
+        finally:
+            registry = get_registry()
+            registry.observe('db_pool_checkout_wait_seconds', time.time() - start,
+                             **_pool_labels(self))
+            self._record_usage(registry)
+
+    def _do_return_conn(self, conn):
+        try:
+            return super(InstrumentedQueuePool, self)._do_return_conn(conn)
+        finally:
+            self._record_usage(get_registry())
+
+    def _record_usage(self, registry):
+        labels = _pool_labels(self)
+        registry.gauge('db_pool_checked_out', self.checkedout(), **labels)
+        registry.gauge('db_pool_overflow', max(self.overflow(), 0), **labels)
+
+
+def instrument_engine(engine, bind=None):
+    """
+    Records pool usage of `engine`, labelled with its `bind` key. Safe to
+    call more than once.
+    """
+    labels = dict(bind=bind or 'default')
+    # Recreated pools (after `dispose()`) keep the listeners but not the labels.
+    engine.pool.metrics_labels = labels
+    if getattr(engine, 'metrics_labels', None) is None:
+        engine.metrics_labels = labels
+        event.listen(engine.pool, 'checkout',
+                     lambda *args: get_registry().inc('db_pool_checkouts_total', **labels))
+        event.listen(engine.pool, 'connect',
+                     lambda *args: get_registry().inc('db_pool_connects_total', **labels))
+
+
+def _pool_labels(pool):
+    return getattr(pool, 'metrics_labels', None) or {}
+
+
+def warm_up(app, count=None):
+    """
+    Opens `count` (default `DB_POOL_WARMUP`) connections to the primary and
+    to every bind (read replicas included) at once and returns them to the
+    pools, so the first requests of a worker find them ready.
+    Call it in the worker process, after any fork.
+    """
+    import config
+    count = app.config.get('DB_POOL_WARMUP', 0) if count is None else count
+    if not count:
+        return 0
+    connections = []
+    with app.app_context():
+        try:
+            for bind in [None] + sorted(app.config.get('SQLALCHEMY_BINDS') or ()):
+                engine = config.db.get_engine(app, bind=bind)
+                for _ in range(count):
+                    connections.append(engine.connect())
+        finally:
+            for connection in connections:
+                connection.close()
+    return len(connections)
+
+
+def replica_binds(app):
+    return ['replica_%s' % i for i in range(len(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()))]
+
+
+def register_replicas(app):
+    """
+    Adds the `SQLALCHEMY_REPLICA_URIS` to `SQLALCHEMY_BINDS`.
+    """
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for key, uri in zip(replica_binds(app), app.config.get('SQLALCHEMY_REPLICA_URIS') or ()):
+        binds[key] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def read_replica(view):
+    """
+    Lets the queries of `view` go to a read replica.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(SignallingSession):
+    """
+    Sends reads of :func:`read_replica` views to a replica picked once per
+    request. Flushes and ``UPDATE``/``DELETE`` statements always go to the
+    primary, and a commit that wrote anything keeps the client on the
+    primary for `DB_STICKY_PRIMARY_SECONDS`.
+    """
+    def __init__(self, db, *args, **kwargs):
+        self.db = db
+        self.replicas = None
+        super(RoutingSession, self).__init__(db, *args, **kwargs)
+        self.replicas = replica_binds(self.app)
+        self.wrote = False
+
+    def get_bind(self, mapper=None, clause=None):
+        if (self.replicas and not self._flushing and not isinstance(clause, UpdateBase)
+                and _reading_replica()):
+            if 'db_replica_bind' not in g:
+                g.db_replica_bind = random.choice(self.replicas)
+            return self.db.get_engine(self.app, bind=g.db_replica_bind)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+def used_replica():
+    """
+    Whether the current request read from a replica.
+    """
+    return has_request_context() and 'db_replica_bind' in g
+
+
+def sticky_to_primary():
+    """
+    Whether the current client reads from the primary after a recent write.
+    """
+    return has_request_context() and session.get(STICKY_KEY, 0) >= time.time()
+
+
+def _reading_replica():
+    return (has_request_context() and g.get('db_read_replica', False)
+            and not sticky_to_primary())
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_engine(self, app=None, bind=None):
+        engine = super(RoutingSQLAlchemy, self).get_engine(app, bind)
+        if getattr(engine.pool, 'metrics_labels', None) is None:
+            instrument_engine(engine, bind)
+        return engine
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(db_session, flush_context):
+    db_session.wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_bulk_update')
+@event.listens_for(RoutingSession, 'after_bulk_delete')
+def _after_bulk(update_context):
+    update_context.session.wrote = True
+
+
+def stick_to_primary(app):
+    """
+    Keeps the current client reading from the primary for
+    `DB_STICKY_PRIMARY_SECONDS`. Done on commit; call it directly when the
+    write was committed outside the request.
+    """
+    if replica_binds(app) and has_request_context():
+        session[STICKY_KEY] = time.time() + app.config.get('DB_STICKY_PRIMARY_SECONDS', 5)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(db_session):
+    if db_session.wrote:
+        stick_to_primary(db_session.app)
+    db_session.wrote = False
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(db_session):
+    db_session.wrote = False
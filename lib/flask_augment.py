@@ -22,21 +22,78 @@ class AugmentError(ValueError):
         """
         return repr(self.errors)
 
+class ValidationPlan(object):
+    """
+    `rules` compiled once into a tuple of `(arg_name, validator, message)`
+    checks. String constraints become precompiled regexes and
+    `(constraint, message)` pairs are unpacked up front, so checking a
+    request only runs the validators.
+    """
+    __slots__ = ('checks', 'check_blank')
+
+    def __init__(self, rules, check_blank=True):
+        self.check_blank = check_blank
+        self.checks = tuple(_compile_rule(arg_name, constraint)
+                            for arg_name, constraint in rules.items())
+
+    def __len__(self):
+        return len(self.checks)
+
+    def check(self, storage):
+        """
+        Returns a `defaultdict(list)` of errors for `storage`, or `None` if
+        every constraint is satisfied.
+        """
+        errors = None
+        check_blank = self.check_blank
+        for arg_name, validator, message in self.checks:
+            arg_val = storage.get(arg_name)
+            if (check_blank or arg_val) and not validator(arg_val):
+                if errors is None:
+                    errors = defaultdict(list)
+                # No user supplied message. Construct a generic message.
+                errors[arg_name].append(message or '"%s" violates constraint.' % arg_val)
+        return errors
+
+    def validate_many(self, payloads):
+        """
+        Checks each of `payloads`. Returns a list with an errors dictionary
+        per payload, empty for the valid ones.
+        """
+        check = self.check
+        return [check(payload) or {} for payload in payloads]
+
+def _compile_rule(arg_name, constraint):
+    message = None
+    if isinstance(constraint, list) or isinstance(constraint, tuple):
+        if len(constraint) == 2:
+            constraint, message = constraint
+        else:
+            raise ValueError('Constraints can either be "(constraint, message)" or "constraint"'
+                            '"%s" is in inproper format' % constraint)
+    # `constraint` can either be a regex or a callable.
+    validator = constraint
+    if not callable(constraint):
+        match = re.compile(constraint).match
+        validator = lambda val: match(str(val))
+    return (arg_name, validator, message)
+
 def ensure_args(storage=None, error_handler=None, check_blank=True, **rules):
     """
     Ensures the value of `arg_name` satisfies `constraint`
     where `rules` is a collection of `arg_name=constraint`.
     """
+    plan = ValidationPlan(rules, check_blank)
     def decorator(fn):
+        get_handler = _handler_resolver(fn, error_handler)
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            handler = error_handler or _get_error_handler(fn)
-            errors = check_args(storage, check_blank, **rules)
+            errors = plan.check(storage or request.args)
             if errors:
                 num_errors = len(errors)
                 plural = 'errors' if num_errors > 1 else 'error'
                 errors['base'].append('%s %s' % (num_errors, plural))
-                return _propogate_error(errors, handler)
+                return _propogate_error(errors, get_handler())
             else:
                 return fn(*args, **kwargs)
         return wrapper
@@ -54,25 +111,28 @@ def ensure_one_of(storage=None, error_handler=None, exclusive=False, check_blank
     Ensures at least(or at most depending on `exclusive)` one of `arg_name`
     is passed and not null.
     """
+    plan = ValidationPlan(rules, check_blank)
+    num_rules = len(plan)
     def decorator(fn):
+        get_handler = _handler_resolver(fn, error_handler)
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            handler = error_handler or _get_error_handler(fn)
-            errors = check_args(storage, check_blank, **rules)
+            errors = plan.check(storage or request.args)
             if errors:
-                valid_count = len(rules) - len(errors)
+                valid_count = num_rules - len(errors)
                 if valid_count < 1:
                     errors['base'].append('One of constraints must validate.')
-                    return _propogate_error(errors, handler)
+                    return _propogate_error(errors, get_handler())
                 elif valid_count > 1 and exclusive:
                     errors['base'].append('Only one of constraints should validate.')
-                    return _propogate_error(errors, handler)
+                    return _propogate_error(errors, get_handler())
                 else:
                     return fn(*args, **kwargs)
             else:
                 if exclusive:
+                    errors = defaultdict(list)
                     errors['base'].append('Only one of constraints should validate.')
-                    return _propogate_error(errors, handler)
+                    return _propogate_error(errors, get_handler())
                 else:
                     return fn(*args, **kwargs)
         return wrapper
@@ -84,45 +144,15 @@ def check_args(storage=None, check_blank=True, **rules):
     dicionary of `arg_name=constraint` and `arg_val` is in `kwargs` or `args`
     """
     storage = storage or request.args
-    results = []
-    for arg_name, constraint in rules.iteritems():
-        # Get the argument value.
-        arg_val = storage.get(arg_name)
-        if check_blank or arg_val:
-            message = None
-            if isinstance(constraint, list) or isinstance(constraint, tuple):
-                if len(constraint) == 2:
-                    constraint, message = constraint
-                else:
-                    raise ValueError('Constraints can either be "(constraint, message)" or "constraint"'
-                                    '"%s" is in inproper format' % constraint)
-            # `constraint` can either be a regex or a callable.
-            validator = constraint
-            if not callable(constraint):
-                validator = lambda val: re.match(constraint, str(val))
-            if message:
-                results.append((arg_name, arg_val, validator(arg_val), message))
-            else:
-                results.append((arg_name, arg_val, validator(arg_val)))
-    return _construct_errors(results, rules)
+    return ValidationPlan(rules, check_blank).check(storage) or defaultdict(list)
 
-def _construct_errors(results, rules):
+def validate_many(payloads, check_blank=True, **rules):
     """
-    Constructs errors dictionary from the returned results.
+    Checks every dictionary like object in `payloads` against `rules`,
+    compiling them only once. Returns a list with an errors dictionary per
+    payload, empty for the valid ones.
     """
-    errors = defaultdict(list)
-    for res in results:
-        message = None
-        if len(res) == 4:
-            arg_name, arg_val, valid, message = res
-        else:
-            arg_name, arg_val, valid = res
-        if not valid:
-            if not message:
-                # No user supplied message. Construct a generic message.
-                message = '"%s" violates constraint.' % arg_val
-            errors[arg_name].append(message)
-    return errors
+    return ValidationPlan(rules, check_blank).validate_many(payloads)
 
 def _propogate_error(errors, handler=None, exception_type=AugmentError):
     """
@@ -133,6 +163,21 @@ def _propogate_error(errors, handler=None, exception_type=AugmentError):
     else:
         raise exception_type(errors)
 
+def _handler_resolver(fn, error_handler=None):
+    """
+    Returns a function giving the error handler for `fn`. The module level
+    `_<fn>_handler` lookup is done on first use only (the handler is usually
+    defined after the decorated function) and then remembered.
+    """
+    if error_handler:
+        return lambda: error_handler
+    resolved = []
+    def get_handler():
+        if not resolved:
+            resolved.append(_get_error_handler(fn))
+        return resolved[0]
+    return get_handler
+
 def _get_error_handler(fn):
     error_handler = None
     if getattr(fn, '__name__', None):
@@ -0,0 +1,90 @@
+"""
+Helpers for running the app under gevent.
+
+- :func:`make_psycopg2_green` makes psycopg2 wait on the gevent hub instead
+  of blocking the whole process on socket I/O.
+- :class:`KeepAliveWSGIHandler` closes connections idle for longer than
+  `keepalive_timeout`, so they don't hold a slot of a bounded pool.
+- :func:`watch_hub` logs greenlets that keep the hub from running for
+  longer than a threshold.
+"""
+import gevent
+from gevent.pywsgi import WSGIHandler
+from gevent.socket import wait_read, wait_write
+
+from lib.metrics import get_registry
+
+try:
+    import psycopg2
+    from psycopg2 import extensions
+except ImportError:
+    psycopg2 = None
+
+
+def make_psycopg2_green():
+    """
+    Installs :func:`gevent_wait_callback` for psycopg2. Has to run before
+    the first connection is made. Returns `False` when psycopg2 is missing.
+    """
+    if psycopg2 is None:
+        return False
+    extensions.set_wait_callback(gevent_wait_callback)
+    return True
+
+
+def gevent_wait_callback(conn, timeout=None):
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError('Bad result from poll: %r' % state)
+
+
+class KeepAliveWSGIHandler(WSGIHandler):
+    #: Seconds to wait for the next request line. `None` waits forever.
+    keepalive_timeout = None
+
+    def read_requestline(self):
+        with gevent.Timeout(self.keepalive_timeout, False):
+            return super(KeepAliveWSGIHandler, self).read_requestline()
+        # An empty request line closes the connection.
+        return ''
+
+
+def pool_size(config):
+    """
+    `GEVENT_POOL_SIZE`, or the most connections the SQLAlchemy pool hands
+    out (``pool_size + max_overflow``) when it isn't set.
+    """
+    if config.get('GEVENT_POOL_SIZE'):
+        return config['GEVENT_POOL_SIZE']
+    options = config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    return (options.get('pool_size', config.get('SQLALCHEMY_POOL_SIZE') or 5) +
+            options.get('max_overflow', config.get('SQLALCHEMY_MAX_OVERFLOW') or 10))
+
+
+def watch_hub(max_blocking_time, logger):
+    """
+    Starts gevent's monitor thread and logs each time a greenlet runs for
+    more than `max_blocking_time` seconds without yielding to the hub.
+    """
+    from gevent import config
+    from gevent.events import EventLoopBlocked, subscribers
+
+    def on_event(event):
+        if isinstance(event, EventLoopBlocked):
+            get_registry().inc('gevent_hub_blocked_total')
+            logger.warning('%r blocked the gevent hub for more than %ss:\n%s',
+                           event.greenlet, event.blocking_time, '\n'.join(event.info))
+
+    config.monitor_thread = True
+    config.max_blocking_time = max_blocking_time
+    if hasattr(config, 'print_blocking_reports'):
+        config.print_blocking_reports = False
+    subscribers.append(on_event)
+    gevent.get_hub().start_periodic_monitoring_thread()
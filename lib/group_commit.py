@@ -0,0 +1,121 @@
+"""
+Write-behind group commit.
+
+Requests hand their writes to a :class:`GroupCommitter` and wait. A
+background thread takes queued writes in micro-batches, up to `max_batch`
+items or `max_delay` seconds after the first one, and commits each batch
+in one transaction. Every waiting request is released once its batch is
+committed, so bursts of writes share a single transaction and fsync.
+
+The thread is started lazily by the first write of each process, so it
+survives forking servers. Under gevent it is a greenlet.
+
+Metrics, with `name` as prefix: ``<name>_batch_size``,
+``<name>_flush_seconds`` and ``<name>_errors_total``.
+"""
+import logging
+import os
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from lib.metrics import get_registry
+
+BATCH_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitTimeout(Exception):
+    """
+    The write wasn't acknowledged in time. It may still be committed later.
+    """
+
+
+class _Entry(object):
+    __slots__ = ('item', 'done', 'error')
+
+    def __init__(self, item):
+        self.item = item
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitter(object):
+    """
+    Calls `flush(items)` from a background thread with batches of the items
+    passed to :meth:`submit`. `flush` must commit the items durably or raise.
+    """
+    def __init__(self, flush, max_batch=100, max_delay=0.005, name='group_commit'):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+
+    def submit(self, item, timeout=None):
+        """
+        Queues `item` and blocks until the batch holding it is committed.
+        Raises the error of a failed flush, or :class:`GroupCommitTimeout`.
+        """
+        entry = _Entry(item)
+        self._get_queue().put(entry)
+        if not entry.done.wait(timeout):
+            raise GroupCommitTimeout('Write not acknowledged in %ss.' % timeout)
+        if entry.error is not None:
+            raise entry.error
+
+    def _get_queue(self):
+        # Threads don't survive a fork, start one per process.
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._queue = queue.Queue()
+                    thread = threading.Thread(target=self._run, args=(self._queue,),
+                                              name=self.name)
+                    thread.daemon = True
+                    thread.start()
+                    self._pid = pid
+        return self._queue
+
+    def _run(self, entries):
+        while True:
+            batch = [entries.get()]
+            deadline = time.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(entries.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        registry = get_registry()
+        start = time.time()
+        try:
+            self.flush([entry.item for entry in batch])
+        except Exception as ex:
+            registry.inc('%s_errors_total' % self.name)
+            if len(batch) == 1:
+                logger.exception('Group commit of 1 item failed.')
+                batch[0].error = ex
+            else:
+                # Don't let one bad item fail the others.
+                for entry in batch:
+                    self._flush([entry])
+                return
+        else:
+            registry.observe('%s_batch_size' % self.name, len(batch), buckets=BATCH_BUCKETS)
+            registry.observe('%s_flush_seconds' % self.name, time.time() - start)
+        for entry in batch:
+            entry.done.set()
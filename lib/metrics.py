@@ -0,0 +1,235 @@
+"""
+Multi-process metrics with Prometheus text exposition.
+
+Every process appends its samples to its own mmap'd file in `METRICS_DIR`
+(``metrics_<pid>.db``). Recording a sample is an in-place float update in
+the mapping; no locks are shared between processes. :func:`expose` reads
+every file in the directory and sums the samples, so any worker can serve
+the metrics of all of them. Empty the directory when the server (not a
+single worker) restarts.
+
+Histograms use log-linear buckets, a few linear steps per power of ten,
+which keeps relative error bounded across the whole range like HDR
+histograms do.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import defaultdict
+
+
+def log_linear_buckets(low_exp, high_exp, steps=(1, 2, 3, 5, 7)):
+    """
+    Bucket bounds ``step * 10**exp`` for each exponent in
+    ``[low_exp, high_exp]``.
+    """
+    return tuple(float('%.10g' % (step * 10 ** exp))
+                 for exp in range(low_exp, high_exp + 1) for step in steps)
+
+#: 100us .. 70s
+LATENCY_BUCKETS = log_linear_buckets(-4, 1)
+#: 128B .. 64MB
+SIZE_BUCKETS = tuple(float(2 ** exp) for exp in range(7, 27))
+
+_HEADER = struct.Struct('i4x')
+_LENGTH = struct.Struct('i')
+_VALUE = struct.Struct('d')
+_INITIAL_SIZE = 1 << 16
+
+
+class MmapValues(object):
+    """
+    Append only `key -> float` store backed by a mmap'd file. Entries are
+    a 4 byte key length, the utf-8 key padded to 8 byte alignment and an
+    8 byte double. The header holds the number of bytes in use, written
+    after each new entry so readers never see a partial one.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(_INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = _HEADER.unpack_from(self._map, 0)[0]
+        if self._used == 0:
+            self._used = _HEADER.size
+            _HEADER.pack_into(self._map, 0, self._used)
+        self._positions = dict((key, pos) for key, _, pos in _read_entries(self._map, self._used))
+
+    def inc(self, key, amount=1.0):
+        with self._lock:
+            pos = self._positions.get(key)
+            if pos is None:
+                pos = self._append(key)
+            _VALUE.pack_into(self._map, pos, _VALUE.unpack_from(self._map, pos)[0] + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            pos = self._positions.get(key)
+            if pos is None:
+                pos = self._append(key)
+            _VALUE.pack_into(self._map, pos, value)
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (-(_LENGTH.size + len(encoded)) % 8)
+        entry = _LENGTH.pack(len(encoded)) + padded + _VALUE.pack(0.0)
+        end = self._used + len(entry)
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        self._map[self._used:end] = entry
+        self._used = end
+        _HEADER.pack_into(self._map, 0, end)
+        pos = end - _VALUE.size
+        self._positions[key] = pos
+        return pos
+
+
+def _read_entries(buf, used):
+    pos = _HEADER.size
+    while pos < used:
+        length = _LENGTH.unpack_from(buf, pos)[0]
+        pos += _LENGTH.size
+        key = bytes(buf[pos:pos + length]).decode('utf-8')
+        pos += length + (-(_LENGTH.size + length) % 8)
+        yield key, _VALUE.unpack_from(buf, pos)[0], pos
+        pos += _VALUE.size
+
+
+def read_file(path):
+    """
+    `(key, value)` pairs stored in the metrics file at `path`.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        return []
+    used = _HEADER.unpack_from(data, 0)[0]
+    return [(key, value) for key, value, _ in _read_entries(data, used)]
+
+
+class Registry(object):
+    """
+    Records counters, gauges and histograms for the current process.
+    Samples are keyed by a JSON ``[kind, name, labels, le]`` list.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._values = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def values(self):
+        # A forked worker must not write into its parent's file.
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    from lib.utils import private_directory
+                    private_directory(self.directory)
+                    self._values = MmapValues(os.path.join(self.directory, 'metrics_%s.db' % pid))
+                    self._pid = pid
+        return self._values
+
+    def inc(self, name, amount=1.0, **labels):
+        self.values.inc(_key('counter', name, labels), amount)
+
+    def gauge(self, name, value, **labels):
+        """
+        Sets a gauge for this process. Gauges are summed across processes.
+        """
+        self.values.set(_key('gauge', name, labels), value)
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        values = self.values
+        for le in buckets:
+            if value <= le:
+                break
+        else:
+            le = '+Inf'
+        values.inc(_key('histogram', name, labels, le))
+        values.inc(_key('histogram', name, labels, 'sum'), value)
+
+    def expose(self):
+        """
+        Prometheus text format of the samples of all processes.
+        """
+        totals = defaultdict(float)
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+            alive = _alive(path)
+            for key, value in read_file(path):
+                # Gauges of exited processes no longer hold.
+                if alive or not key.startswith('["gauge"'):
+                    totals[key] += value
+        families = defaultdict(list)
+        histograms = defaultdict(dict)
+        for key, value in totals.items():
+            kind, name, labels, le = json.loads(key)
+            labels = tuple(tuple(pair) for pair in labels)
+            if kind == 'histogram':
+                histograms[(name, labels)][le] = value
+            else:
+                families[(kind, name)].append((name, labels, value))
+        for (name, labels), buckets in histograms.items():
+            samples = families[('histogram', name)]
+            bounds = sorted((le for le in buckets if le not in ('sum', '+Inf')))
+            count = 0.0
+            for le in bounds:
+                count += buckets[le]
+                samples.append(('%s_bucket' % name, labels + (('le', repr(le)),), count))
+            count += buckets.get('+Inf', 0.0)
+            samples.append(('%s_bucket' % name, labels + (('le', '+Inf'),), count))
+            samples.append(('%s_sum' % name, labels, buckets.get('sum', 0.0)))
+            samples.append(('%s_count' % name, labels, count))
+        lines = []
+        for (kind, name), samples in sorted(families.items(), key=lambda item: item[0][1]):
+            lines.append('# TYPE %s %s' % (name, kind))
+            for sample_name, labels, value in samples:
+                lines.append('%s%s %r' % (sample_name, _format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(path):
+    try:
+        pid = int(os.path.basename(path)[len('metrics_'):-len('.db')])
+        os.kill(pid, 0)
+    except (ValueError, OSError):
+        return False
+    return True
+
+
+def _key(kind, name, labels, le=None):
+    return json.dumps([kind, name, sorted(labels.items()), le], separators=(',', ':'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in labels)
+
+
+_registry = None
+
+def get_registry():
+    """
+    The process wide :class:`Registry`, writing to `METRICS_DIR`.
+    """
+    global _registry
+    if _registry is None:
+        import config.settings as settings
+        directory = getattr(settings, 'METRICS_DIR', None) or \
+            os.path.join(tempfile.gettempdir(), 'flask-metrics-%s' % os.getuid())
+        _registry = Registry(directory)
+    return _registry
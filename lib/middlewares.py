@@ -1,3 +1,14 @@
+import threading
+import time
+import zlib
+
+from lib.metrics import SIZE_BUCKETS
+from lib.static import compressible_mimetype
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 class MethodRewriteMiddleware(object):
@@ -24,3 +35,310 @@ class MethodRewriteMiddleware(object):
         if method in self.bodyless_methods:
             environ['CONTENT_LENGTH'] = '0'
         return self.app(environ, start_response)
+
+
+class MetricsMiddleware(object):
+    """
+    Records per endpoint request counts by status class, latency and
+    response size histograms, and the time spent in before request
+    handlers, the view and template rendering. Samples are served in
+    Prometheus text format on `path`, see :mod:`lib.metrics`.
+    """
+    def __init__(self, app, path='/_metrics'):
+        from flask import request_started, before_render_template, template_rendered
+        from lib.metrics import get_registry
+        self.app = app
+        self.path = path
+        self.registry = get_registry()
+        self._instrumented = set()
+        self._instrument_lock = threading.Lock()
+        request_started.connect(self._instrument, weak=False)
+        before_render_template.connect(self._render_started, weak=False)
+        template_rendered.connect(self._render_finished, weak=False)
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == self.path:
+            body = self.registry.expose().encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4'),
+                                      ('Content-Length', str(len(body)))])
+            return [body]
+        start = time.time()
+        phases = environ['metrics.phases'] = {}
+        status = []
+        headers_sent = {}
+
+        def _start_response(status_line, headers, exc_info=None):
+            status.append(status_line)
+            headers_sent.update((k.lower(), v) for k, v in headers)
+            return start_response(status_line, headers, exc_info)
+
+        def record(size):
+            endpoint = environ.get('metrics.endpoint') or 'none'
+            status_class = '%sxx' % status[0][0] if status else '5xx'
+            registry = self.registry
+            registry.inc('http_requests_total', endpoint=endpoint,
+                         method=environ.get('REQUEST_METHOD'), status=status_class)
+            registry.observe('http_request_duration_seconds', time.time() - start, endpoint=endpoint)
+            registry.observe('http_response_size_bytes', size, buckets=SIZE_BUCKETS, endpoint=endpoint)
+            for phase, seconds in phases.items():
+                registry.observe('http_request_phase_seconds', seconds, endpoint=endpoint, phase=phase)
+
+        try:
+            app_iter = self.app(environ, _start_response)
+        except Exception:
+            record(0)
+            raise
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(app_iter, file_wrapper):
+            # Wrapping would stop the server from sending the file zero-copy.
+            record(int(headers_sent.get('content-length') or 0))
+            return app_iter
+        return _CountingIterable(app_iter, record)
+
+    def _instrument(self, app, **extra):
+        # The Flask app is only reachable through signals from a WSGI
+        # middleware; wrap its request phases once, on its first request.
+        if id(app) in self._instrumented:
+            return
+        with self._instrument_lock:
+            # First requests may arrive together on a threaded server.
+            if id(app) in self._instrumented:
+                return
+            self._wrap_phases(app)
+            self._instrumented.add(id(app))
+
+    def _wrap_phases(self, app):
+        preprocess_request, dispatch_request = app.preprocess_request, app.dispatch_request
+
+        def timed_preprocess_request():
+            from flask import request
+            request.environ['metrics.endpoint'] = request.endpoint
+            start = time.time()
+            try:
+                return preprocess_request()
+            finally:
+                _add_phase(request.environ, 'before_request', time.time() - start)
+
+        def timed_dispatch_request():
+            from flask import request
+            start = time.time()
+            try:
+                return dispatch_request()
+            finally:
+                phases = request.environ.get('metrics.phases', {})
+                # Rendering is reported on its own.
+                _add_phase(request.environ, 'view', time.time() - start - phases.get('render', 0.0))
+
+        app.preprocess_request = timed_preprocess_request
+        app.dispatch_request = timed_dispatch_request
+
+    def _render_started(self, app, template, context, **extra):
+        from flask import request
+        if request:
+            request.environ['metrics.render_start'] = time.time()
+
+    def _render_finished(self, app, template, context, **extra):
+        from flask import request
+        if request:
+            start = request.environ.pop('metrics.render_start', None)
+            if start is not None:
+                _add_phase(request.environ, 'render', time.time() - start)
+
+
+def _add_phase(environ, phase, seconds):
+    phases = environ.get('metrics.phases')
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+class _CountingIterable(object):
+    """
+    Passes the chunks of `app_iter` through, calling `on_close` with the
+    number of bytes sent once the server closes it.
+    """
+    def __init__(self, app_iter, on_close):
+        self.app_iter = app_iter
+        self.on_close = on_close
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.app_iter:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            self.on_close(self.size)
+
+
+class CompressionMiddleware(object):
+    """
+    Compresses compressible responses with brotli (if the package is
+    installed), gzip or deflate, whichever the client prefers. The body is
+    compressed chunk by chunk as the app yields it, with a sync flush after
+    each chunk so streamed pages still arrive progressively.
+
+    Responses smaller than `min_size`, already encoded, partial, sent with
+    X-Sendfile or a ``wsgi.file_wrapper``, or of other content types are
+    passed through as the app returned them. When the length isn't known up
+    front, up to `min_size` bytes are held back to decide.
+    """
+    def __init__(self, app, level=None, min_size=None, brotli_quality=None):
+        import config.settings as settings
+        self.app = app
+        self.level = level if level is not None else getattr(settings, 'COMPRESS_LEVEL', 6)
+        self.min_size = min_size if min_size is not None else getattr(settings, 'COMPRESS_MIN_SIZE', 1024)
+        self.brotli_quality = brotli_quality if brotli_quality is not None else \
+            getattr(settings, 'COMPRESS_BROTLI_QUALITY', 4)
+
+    def __call__(self, environ, start_response):
+        encoding = self._negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if not encoding or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+        response = {}
+
+        def _start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response.update(status=status, headers=headers)
+            return _not_supported
+
+        app_iter = self.app(environ, _start_response)
+        if 'status' in response and not self._should_compress(environ, app_iter, response):
+            # Pass the body through untouched, file wrappers stay zero-copy.
+            response['sent'] = True
+            start_response(response['status'], response['headers'])
+            return app_iter
+        return self._respond(environ, app_iter, response, encoding, start_response)
+
+    def _respond(self, environ, app_iter, response, encoding, start_response):
+        try:
+            chunks = iter(app_iter)
+            held, held_size, done = [], 0, False
+            compress = self._should_compress(environ, app_iter, response)
+            if compress and not _header(response['headers'], 'content-length'):
+                for chunk in chunks:
+                    held.append(chunk)
+                    held_size += len(chunk)
+                    if held_size >= self.min_size:
+                        break
+                else:
+                    done = True
+                    compress = held_size >= self.min_size
+            response['sent'] = True
+            if not compress:
+                start_response(response['status'], response['headers'])
+                for chunk in held:
+                    yield chunk
+                for chunk in chunks:
+                    yield chunk
+                return
+            start_response(response['status'], self._compressed_headers(response['headers'], encoding))
+            compressor = _Compressor(encoding, self.level, self.brotli_quality)
+            for chunk in held:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            if not done:
+                for chunk in chunks:
+                    data = compressor.compress(chunk, flush=True)
+                    if data:
+                        yield data
+            yield compressor.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    def _negotiate(self, accept_encoding):
+        accepted = {}
+        for part in accept_encoding.lower().split(','):
+            name, _, params = part.strip().partition(';')
+            q = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[name.strip()] = q
+        for encoding in (('br',) if brotli is not None else ()) + ('gzip', 'deflate'):
+            if accepted.get(encoding, 0.0) > 0:
+                return encoding
+        return None
+
+    def _should_compress(self, environ, app_iter, response):
+        status, headers = response['status'], response['headers']
+        if not status.startswith('200'):
+            return False
+        # The front server sends X-Sendfile files, the body is empty.
+        for name in ('content-encoding', 'content-range', 'x-sendfile'):
+            if _header(headers, name) is not None:
+                return False
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(app_iter, file_wrapper):
+            return False
+        if 'no-transform' in (_header(headers, 'cache-control') or ''):
+            return False
+        if not compressible_mimetype(_header(headers, 'content-type')):
+            return False
+        length = _header(headers, 'content-length')
+        return length is None or int(length) >= self.min_size
+
+    def _compressed_headers(self, headers, encoding):
+        new_headers = []
+        vary = []
+        for name, value in headers:
+            lower = name.lower()
+            if lower in ('content-length', 'accept-ranges'):
+                # Ranges of the compressed body can't be served.
+                continue
+            if lower == 'etag' and not value.startswith('W/'):
+                # The compressed body is a different representation.
+                value = 'W/' + value
+            if lower == 'vary':
+                vary.extend(v.strip() for v in value.split(',') if v.strip())
+                continue
+            new_headers.append((name, value))
+        new_headers.append(('Content-Encoding', encoding))
+        if not any(v == '*' or v.lower() == 'accept-encoding' for v in vary):
+            vary.append('Accept-Encoding')
+        new_headers.append(('Vary', ', '.join(vary)))
+        return new_headers
+
+
+def _header(headers, name):
+    """
+    Value of header `name` (lower case) in the WSGI `headers` list, or None.
+    """
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _not_supported(data):
+    raise NotImplementedError('CompressionMiddleware does not support the WSGI write callable.')
+
+
+class _Compressor(object):
+    def __init__(self, encoding, level, brotli_quality):
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._brotli = None
+            wbits = 31 if encoding == 'gzip' else 15
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data, flush=False):
+        if self._brotli:
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        if self._brotli:
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
@@ -0,0 +1,193 @@
+"""
+Keyset (cursor) pagination for SQLAlchemy queries.
+
+Unlike ``LIMIT/OFFSET`` paging, the cost of fetching a page does not grow
+with its position: every page is an indexed range scan on a unique key.
+"""
+from flask import request, current_app
+
+from lib.streaming import streaming
+
+#: Defaults used when `PAGINATION_PER_PAGE`/`PAGINATION_MAX_PER_PAGE`
+#: aren't set in the app config.
+PER_PAGE = 20
+MAX_PER_PAGE = 100
+#: Defaults for streaming routes, see `STREAM_PER_PAGE`, `STREAM_MAX_PER_PAGE`
+#: and `STREAM_YIELD_PER`.
+STREAM_PER_PAGE = 1000
+STREAM_MAX_PER_PAGE = 10000
+YIELD_PER = 500
+
+
+class KeysetPage(object):
+    """
+    One page of rows ordered ascending on a unique key.
+    `next_cursor` and `prev_cursor` are the key values to pass as `after`
+    and `before` to get the neighbouring pages; `None` at either end.
+    """
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        #: Approximate row count. Only computed on request.
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StreamedKeysetPage(KeysetPage):
+    """
+    A :class:`KeysetPage` whose rows are read from the DB in batches of
+    `batch_size` while it is iterated, for streamed rendering. It can be
+    iterated once; `next_cursor` and `prev_cursor` are known after that.
+    """
+    def __init__(self, query, key, after, per_page, batch_size, on_batch=None):
+        super(StreamedKeysetPage, self).__init__(None, per_page)
+        self.query = query
+        self.key = key
+        self.after = after
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self._last = None
+
+    def __iter__(self):
+        query = self.query
+        if self.after is not None:
+            query = query.filter(self.key > self.after)
+        rows = query.order_by(self.key.asc()).limit(self.per_page + 1).yield_per(self.batch_size)
+        attr = self.key.key
+        count = 0
+        batch = []
+        for row in rows:
+            if count + len(batch) == self.per_page:
+                # The extra row: there is a next page.
+                self.next_cursor = getattr(batch[-1] if batch else self._last, attr)
+                break
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                for item in self._flush(batch, count):
+                    yield item
+                count += len(batch)
+                batch = []
+        for item in self._flush(batch, count):
+            yield item
+
+    def _flush(self, batch, count):
+        if not batch:
+            return batch
+        if count == 0 and self.after is not None:
+            self.prev_cursor = getattr(batch[0], self.key.key)
+        self._last = batch[-1]
+        if self.on_batch:
+            self.on_batch(batch)
+        return batch
+
+    def __len__(self):
+        raise TypeError('Length of a streamed page is not known in advance.')
+
+
+def keyset_paginate(query, key, after=None, before=None, per_page=PER_PAGE, with_total=False,
+                    on_batch=None):
+    """
+    Returns a :class:`KeysetPage` of `query` ordered on the unique column `key`
+    (eg. ``Post.id``). Rows strictly after `after` or strictly before `before`
+    are returned. One row more than `per_page` is fetched to find out if there
+    is another page in the direction of travel.
+
+    `on_batch`, if given, is called with the fetched rows before they are
+    returned, eg. to batch load related data for them.
+    """
+    attr = key.key
+    base = query
+    if before is not None:
+        rows = query.filter(key < before).order_by(key.desc()).limit(per_page + 1).all()
+        more = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        prev_cursor = getattr(items[0], attr) if more else None
+        next_cursor = getattr(items[-1], attr) if items else None
+    else:
+        if after is not None:
+            query = query.filter(key > after)
+        rows = query.order_by(key.asc()).limit(per_page + 1).all()
+        more = len(rows) > per_page
+        items = rows[:per_page]
+        next_cursor = getattr(items[-1], attr) if more else None
+        prev_cursor = getattr(items[0], attr) if items and after is not None else None
+    if on_batch and items:
+        on_batch(items)
+    total = approximate_count(base, key) if with_total else None
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
+
+
+def paginate_request(query, key, with_total=None, on_batch=None):
+    """
+    :func:`keyset_paginate` driven by the current request's ``after``,
+    ``before``, ``per_page`` and ``total`` query args. `per_page` is clamped
+    to `PAGINATION_MAX_PER_PAGE`.
+
+    On streaming routes (see :mod:`lib.streaming`) forward pages are returned
+    as a :class:`StreamedKeysetPage` using the `STREAM_*` limits instead.
+    """
+    config = current_app.config
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    stream = streaming() and before is None
+    if stream:
+        default_per_page = config.get('STREAM_PER_PAGE', STREAM_PER_PAGE)
+        max_per_page = config.get('STREAM_MAX_PER_PAGE', STREAM_MAX_PER_PAGE)
+    else:
+        default_per_page = config.get('PAGINATION_PER_PAGE', PER_PAGE)
+        max_per_page = config.get('PAGINATION_MAX_PER_PAGE', MAX_PER_PAGE)
+    per_page = request_per_page(default_per_page, max_per_page)
+    if with_total is None:
+        with_total = bool(request.args.get('total'))
+    if stream:
+        page = StreamedKeysetPage(query, key, after, per_page,
+                                  config.get('STREAM_YIELD_PER', YIELD_PER), on_batch=on_batch)
+        if with_total:
+            page.total = approximate_count(query, key)
+        return page
+    return keyset_paginate(query, key, after=after, before=before, per_page=per_page,
+                           with_total=with_total, on_batch=on_batch)
+
+
+def request_per_page(default=None, maximum=None):
+    """
+    The request's ``per_page`` arg clamped to ``[1, maximum]``. Defaults
+    come from `PAGINATION_PER_PAGE` and `PAGINATION_MAX_PER_PAGE`.
+    """
+    config = current_app.config
+    if default is None:
+        default = config.get('PAGINATION_PER_PAGE', PER_PAGE)
+    if maximum is None:
+        maximum = config.get('PAGINATION_MAX_PER_PAGE', MAX_PER_PAGE)
+    return max(1, min(request.args.get('per_page', default, type=int), maximum))
+
+
+def approximate_count(query, key):
+    """
+    Cheap row count for the table `key` belongs to. On Postgres the planner
+    estimate from ``pg_class`` is used, elsewhere it falls back to ``COUNT``.
+    """
+    session = query.session
+    table = key.class_.__table__
+    bind = session.get_bind()
+    if bind.dialect.name == 'postgresql':
+        estimate = session.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = :name',
+                                   {'name': table.name}).scalar()
+        if estimate is not None and estimate >= 0:
+            return estimate
+    return query.order_by(None).count()
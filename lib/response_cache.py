@@ -0,0 +1,138 @@
+"""
+Full-page response caching on top of `config.cache` with tag based invalidation.
+
+Each cached page records the tags it depends on together with the generation
+of every tag at the time it was rendered. Writes call :func:`invalidate` which
+gives the tags new generations; a cached page whose recorded generations no
+longer match is treated as a miss. Only the pages sharing a tag with a write
+are thrown away.
+"""
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, current_app, g, Response
+
+import config
+from lib.db import used_replica, sticky_to_primary
+
+#: Used when `RESPONSE_CACHE_TIMEOUT` is not set in the app config.
+DEFAULT_TIMEOUT = 300
+
+
+def cache_response(tags=None, timeout=None, vary_session=False):
+    """
+    Caches successful ``GET``/``HEAD`` responses of the decorated view.
+
+    `tags` is a list of tag names or a callable taking the view kwargs and
+    returning one. Views can add more tags while rendering with
+    :func:`tag_response`. When `vary_session` is set the cache key includes
+    the session's CSRF token, for pages that embed a form.
+
+    Responses are not cached when there are pending flashed messages, when
+    rendering modified the session or when the response is streamed.
+
+    A read replica may lag behind the writes that produced the current tag
+    generations, so responses rendered from one are kept for at most
+    `DB_STICKY_PRIMARY_SECONDS` and aren't served to clients that read
+    from the primary after a write of their own.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache = getattr(config, 'cache', None)
+            if (cache is None or request.method not in ('GET', 'HEAD')
+                    or '_flashes' in session):
+                return fn(*args, **kwargs)
+            static_tags = tags(**kwargs) if callable(tags) else list(tags or ())
+            key = _cache_key(vary_session)
+            entry = cache.get(key)
+            if entry is not None:
+                entry_tags, entry_gens, status, headers, body = entry[:5]
+                from_replica = entry[5] if len(entry) > 5 else False
+                if (_generations(cache, entry_tags) == entry_gens
+                        and not (from_replica and sticky_to_primary())):
+                    return Response(body, status, headers)
+            # Snapshot static tags before rendering so that a write racing
+            # with this render leaves the entry stale rather than hiding it.
+            g.response_cache_tags = list(zip(static_tags,
+                                             _generations(cache, static_tags, create=True)))
+            response = current_app.make_response(fn(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed or session.modified:
+                return response
+            entry_tags = [tag for tag, gen in g.response_cache_tags]
+            entry_gens = [gen for tag, gen in g.response_cache_tags]
+            if _generations(cache, entry_tags) != entry_gens:
+                # Invalidated while rendering: the page may show older rows.
+                return response
+            entry_timeout = timeout or current_app.config.get('RESPONSE_CACHE_TIMEOUT',
+                                                              DEFAULT_TIMEOUT)
+            from_replica = used_replica()
+            if from_replica:
+                entry_timeout = min(entry_timeout,
+                                    current_app.config.get('DB_STICKY_PRIMARY_SECONDS', 5))
+            cache.set(key, (entry_tags, entry_gens, response.status_code,
+                            list(response.headers.items()), response.get_data(), from_replica),
+                      timeout=entry_timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def tag_response(*tags):
+    """
+    Adds `tags` to the response being rendered by a :func:`cache_response`
+    view. Call it as soon as the rows the tags stand for are read: their
+    generations are taken now, and the response isn't cached if any of
+    them changes before rendering ends.
+    """
+    cache_tags = getattr(g, 'response_cache_tags', None)
+    if cache_tags is not None:
+        known = set(tag for tag, gen in cache_tags)
+        tags = [tag for tag in OrderedDict.fromkeys(tags) if tag not in known]
+        cache_tags.extend(zip(tags, _generations(config.cache, tags, create=True)))
+
+
+def invalidate(*tags):
+    """
+    Expires every cached response tagged with any of `tags`.
+    """
+    cache = getattr(config, 'cache', None)
+    if cache is not None and tags:
+        cache.set_many(dict((_tag_key(tag), _new_generation()) for tag in tags), timeout=0)
+
+
+def _cache_key(vary_session):
+    args = sorted(request.args.items(multi=True))
+    view_args = sorted((request.view_args or {}).items())
+    key = 'response:%s:%r:%r' % (request.endpoint, view_args, args)
+    if vary_session:
+        key = '%s:%s' % (key, session.get('csrf_token', ''))
+    return key
+
+
+def _tag_key(tag):
+    return 'response-tag:%s' % tag
+
+
+def _new_generation():
+    return uuid.uuid4().hex
+
+
+def _generations(cache, tags, create=False):
+    """
+    Current generation for each of `tags`. Missing tags compare unequal to any
+    stored entry; with `create` they are given a generation first.
+    """
+    if not tags:
+        return []
+    keys = [_tag_key(tag) for tag in tags]
+    gens = list(cache.get_many(*keys))
+    if create:
+        for i, gen in enumerate(gens):
+            if gen is None:
+                gen = _new_generation()
+                if not cache.add(keys[i], gen, timeout=0):
+                    gen = cache.get(keys[i])
+                gens[i] = gen
+    return gens
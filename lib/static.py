@@ -0,0 +1,150 @@
+"""
+Static file serving from precompressed siblings.
+
+`flask static_compress` (and `flask assets_build` for the bundles it
+writes) stores ``.br`` and ``.gz`` versions next to compressible static
+files. :func:`send_static` picks the smallest variant the client accepts,
+so nothing is compressed per request, and sends it through X-Sendfile when
+`USE_X_SENDFILE` is on, or through the server's ``wsgi.file_wrapper``
+otherwise. Range requests are answered for the identity variant.
+"""
+import gzip
+import mimetypes
+import os
+import shutil
+from zlib import adler32
+
+from flask import request, current_app
+from flask.helpers import safe_join
+from werkzeug.exceptions import NotFound
+from werkzeug.wsgi import wrap_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#: Content types worth storing compressed.
+COMPRESSIBLE_TYPES = frozenset(['application/javascript', 'application/json', 'application/x-ndjson',
+                                'application/xml', 'image/svg+xml'])
+#: Files smaller than this aren't compressed.
+MIN_SIZE = 1024
+
+#: `(Content-Encoding, file suffix)` in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def is_compressible(path):
+    return compressible_mimetype(mimetypes.guess_type(path)[0])
+
+
+def compressible_mimetype(mimetype):
+    mimetype = (mimetype or '').split(';')[0].strip().lower()
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def compress_file(path, min_size=MIN_SIZE):
+    """
+    Writes ``.gz`` and, if the `brotli` package is installed, ``.br``
+    versions of `path`. Variants not smaller than the original are removed.
+    Returns the paths written.
+    """
+    written = []
+    size = os.path.getsize(path)
+    if size < min_size or not is_compressible(path):
+        return written
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = [('.gz', lambda: gzip.compress(data, 9))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(data, quality=11)))
+    for suffix, compress in variants:
+        compressed = compress()
+        target = path + suffix
+        if len(compressed) < size:
+            with open(target + '.tmp', 'wb') as f:
+                f.write(compressed)
+            shutil.copystat(path, target + '.tmp')
+            os.rename(target + '.tmp', target)
+            written.append(target)
+        elif os.path.exists(target):
+            os.remove(target)
+    return written
+
+
+def compress_tree(directory, min_size=MIN_SIZE):
+    """
+    :func:`compress_file` for every file below `directory`.
+    """
+    written = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(('.gz', '.br', '.tmp')):
+                written.extend(compress_file(os.path.join(root, name), min_size))
+    return written
+
+
+def send_static(directory, filename):
+    """
+    Serves `filename` from `directory` using the best precompressed variant
+    the request accepts.
+    """
+    path = safe_join(directory, filename)
+    if not os.path.isfile(path):
+        raise NotFound()
+    encoding = None
+    # Byte ranges of an encoded variant are not ranges of the file the
+    # client asked for, so range requests get the identity variant.
+    if 'Range' not in request.headers:
+        accepted = request.accept_encodings
+        for candidate, suffix in ENCODINGS:
+            if accepted[candidate] and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+    stat = os.stat(path)
+
+    app = current_app
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if app.use_x_sendfile:
+        headers['X-Sendfile'] = path
+        response = app.response_class(None, mimetype=mimetype, headers=headers,
+                                      direct_passthrough=True)
+    else:
+        response = app.response_class(wrap_file(request.environ, open(path, 'rb')),
+                                      mimetype=mimetype, headers=headers, direct_passthrough=True)
+    response.content_length = stat.st_size
+    response.last_modified = stat.st_mtime
+    response.set_etag('%s-%s-%s' % (int(stat.st_mtime), stat.st_size,
+                                    adler32(path.encode('utf-8')) & 0xffffffff))
+    max_age = app.get_send_file_max_age(filename)
+    if max_age is not None:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    # With X-Sendfile the web server answers ranges itself.
+    ranges = not encoding and not app.use_x_sendfile
+    return response.make_conditional(request, accept_ranges=ranges,
+                                      complete_length=stat.st_size if ranges else None)
+
+
+def set_static_views(app):
+    """
+    Serves the app's and every blueprint's ``static`` endpoint with
+    :func:`send_static`.
+    """
+    for endpoint in list(app.view_functions):
+        if endpoint == 'static':
+            folder = app.static_folder
+        elif endpoint.endswith('.static') and endpoint[:-len('.static')] in app.blueprints:
+            folder = app.blueprints[endpoint[:-len('.static')]].static_folder
+        else:
+            continue
+        app.view_functions[endpoint] = _static_view(folder)
+
+
+def _static_view(folder):
+    def static(filename):
+        return send_static(folder, filename)
+    return static
@@ -0,0 +1,48 @@
+"""
+Streaming template rendering for listing views.
+
+Routes opt in with ``{'stream': True}`` in their opts dict (see
+:func:`config.urls.set_urls`). Views render through :func:`render_listing`,
+which sends the template out in chunks as it is generated instead of
+building the whole page in memory first.
+"""
+from functools import wraps
+
+from flask import g, current_app, render_template, stream_with_context
+
+#: Used when `STREAM_BUFFER_SIZE` isn't set in the app config.
+BUFFER_SIZE = 20
+
+
+def streamed(view_func):
+    """
+    Marks requests handled by `view_func` as streaming.
+    """
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        g.stream_template = True
+        return view_func(*args, **kwargs)
+    return wrapper
+
+
+def streaming():
+    """
+    Whether the current request is served by a streaming route.
+    """
+    return g.get('stream_template', False)
+
+
+def render_listing(template_name, **context):
+    """
+    Like ``render_template``, but on streaming routes returns a response
+    whose body is generated from the template lazily. Iterables in `context`
+    are consumed as the page is sent, so rows can be read from the DB in
+    batches while rendering.
+    """
+    if not streaming():
+        return render_template(template_name, **context)
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(app.config.get('STREAM_BUFFER_SIZE', BUFFER_SIZE))
+    return app.response_class(stream_with_context(stream))
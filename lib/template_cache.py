@@ -0,0 +1,60 @@
+"""
+Jinja fragment caching on top of `config.cache`::
+
+    {% cache ('post-comments', post.id, post.version), 600 %}
+        ...
+    {% endcache %}
+
+The key is a string or a sequence of parts joined with ``:``. Put the
+version of every model the fragment shows in it: a write bumps the
+version, so stale fragments are just never read again and expire. The
+timeout defaults to `FRAGMENT_CACHE_TIMEOUT`.
+
+Each tag is one cache round trip. Cache large fragments, not every row
+of a long loop: that costs more than rendering the rows.
+"""
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+import config
+
+#: Used when `FRAGMENT_CACHE_TIMEOUT` is not set in the app config.
+DEFAULT_TIMEOUT = 300
+
+
+class FragmentCacheExtension(Extension):
+    tags = set(['cache'])
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', args), [], [], body).set_lineno(lineno)
+
+    def _cache(self, key, timeout, caller):
+        cache = getattr(config, 'cache', None)
+        if cache is None:
+            return caller()
+        key = fragment_key(key)
+        entry = cache.get(key)
+        if entry is not None:
+            text, markup = entry
+            return Markup(text) if markup else text
+        rv = caller()
+        if timeout is None:
+            timeout = current_app.config.get('FRAGMENT_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+        # Autoescaped templates render to `Markup`, which must not be escaped again.
+        cache.set(key, (str(rv), isinstance(rv, Markup)), timeout=timeout)
+        return rv
+
+
+def fragment_key(key):
+    if isinstance(key, (list, tuple)):
+        key = ':'.join(str(part) for part in key)
+    return 'fragment:%s' % key
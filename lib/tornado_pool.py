@@ -0,0 +1,119 @@
+"""
+Runs WSGI requests for tornado on a bounded thread pool.
+
+`tornado.wsgi.WSGIContainer` calls the app on the IOLoop thread, so a
+single slow request stalls every connection. :class:`ThreadPoolWSGIContainer`
+hands the app call to a pool of `max_workers` threads and only writes the
+finished response on the IOLoop. At most `max_queue` requests wait for a
+free thread; past that new requests get a 503 straight away.
+
+The response body is buffered in the worker thread, like `WSGIContainer`
+does, so streamed responses are sent in one piece.
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import tornado
+from tornado import escape, httputil
+from tornado.ioloop import IOLoop
+from tornado.log import app_log
+from tornado.wsgi import WSGIContainer
+
+from lib.metrics import get_registry
+
+_UNAVAILABLE = b'<h1>Service Unavailable</h1>'
+
+
+class ThreadPoolWSGIContainer(WSGIContainer):
+    def __init__(self, wsgi_application, max_workers, max_queue=0):
+        super(ThreadPoolWSGIContainer, self).__init__(wsgi_application)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers)
+        #: Requests submitted and not written yet. Only used on the IOLoop thread.
+        self.pending = 0
+
+    def __call__(self, request):
+        registry = get_registry()
+        if self.pending >= self.max_workers + self.max_queue:
+            registry.inc('tornado_requests_rejected_total')
+            self._write(request, '503 Service Unavailable',
+                        [('Retry-After', '1'), ('Content-Type', 'text/html; charset=UTF-8')],
+                        _UNAVAILABLE)
+            return
+        self.pending += 1
+        self._set_depth(registry)
+        future = self.executor.submit(self._call_app, request, time.time())
+        IOLoop.current().add_future(future, partial(self._finish, request))
+
+    def _call_app(self, request, queued):
+        get_registry().observe('tornado_queue_wait_seconds', time.time() - queued)
+        data = {}
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            data['status'] = status
+            data['headers'] = headers
+            return response.append
+
+        app_response = self.wsgi_application(self.environ(request), start_response)
+        try:
+            response.extend(app_response)
+            body = b''.join(response)
+        finally:
+            if hasattr(app_response, 'close'):
+                app_response.close()
+        if not data:
+            raise Exception('WSGI app did not call start_response')
+        return data['status'], data['headers'], body
+
+    def _finish(self, request, future):
+        self.pending -= 1
+        self._set_depth(get_registry())
+        try:
+            status, headers, body = future.result()
+        except Exception:
+            app_log.error('Uncaught exception in WSGI app', exc_info=sys.exc_info())
+            status, headers, body = '500 Internal Server Error', [], b''
+        self._write(request, status, headers, body)
+
+    def _set_depth(self, registry):
+        registry.gauge('tornado_queue_depth', max(0, self.pending - self.max_workers))
+
+    def _write(self, request, status, headers, body):
+        status_code, reason = status.split(' ', 1)
+        status_code = int(status_code)
+        header_set = set(k.lower() for k, v in headers)
+        body = escape.utf8(body)
+        if status_code != 304:
+            if 'content-length' not in header_set:
+                headers.append(('Content-Length', str(len(body))))
+            if 'content-type' not in header_set:
+                headers.append(('Content-Type', 'text/html; charset=UTF-8'))
+        if 'server' not in header_set:
+            headers.append(('Server', 'TornadoServer/%s' % tornado.version))
+        start_line = httputil.ResponseStartLine('HTTP/1.1', status_code, reason)
+        header_obj = httputil.HTTPHeaders()
+        for key, value in headers:
+            header_obj.add(key, value)
+        request.connection.write_headers(start_line, header_obj, chunk=body)
+        request.connection.finish()
+        self._log(status_code, request)
+
+    def drain(self, timeout, callback):
+        """
+        Calls `callback` on the IOLoop once no requests are pending or after
+        `timeout` seconds, then shuts the pool down.
+        """
+        loop = IOLoop.current()
+        deadline = loop.time() + timeout
+
+        def check():
+            if self.pending and loop.time() < deadline:
+                loop.call_later(0.1, check)
+            else:
+                self.executor.shutdown(wait=False)
+                callback()
+        check()
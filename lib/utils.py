@@ -2,6 +2,16 @@
 """
 Misc. utilities.
 """
+import hmac
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask.cli import AppGroup
+
+
 def set_trace():
     """
     Wrapper for ``pdb.set_trace``.
@@ -20,30 +30,212 @@ def simple_form(form_type, template, success):
         return render_template(template, form=form)
     return fn
 
-def http_auth(username, password, include, *endpoints):
-    from flask import request, Response
+class TTLCache(object):
+    """
+    Thread safe, size bounded mapping whose entries expire `ttl` seconds
+    after being set. The least recently set entry is evicted when full.
+    """
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.time():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time() + self.ttl)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+def http_auth(username, password_hash, include, *endpoints):
+    """
+    Returns a before request handler enforcing HTTP basic auth against
+    `username` and the bcrypt `password_hash` on `endpoints` (or on every
+    endpoint but those when `include` is false).
+
+    Successful verifications are remembered in a :class:`TTLCache` keyed by
+    a HMAC of the ``Authorization`` header, sized by `HTTP_AUTH_CACHE_SIZE`
+    and `HTTP_AUTH_CACHE_TTL`, so only the first request of a client pays
+    for bcrypt. Whether an endpoint is protected is decided once per endpoint.
+    """
+    from flask import request, Response, current_app
+    endpoints = frozenset(endpoints)
+    decisions = {}
+    verified = []
+
+    def is_protected(endpoint):
+        decision = decisions.get(endpoint)
+        if decision is None:
+            decision = not endpoint.startswith('_') and ((endpoint in endpoints) == include)
+            decisions[endpoint] = decision
+        return decision
+
+    def check(header, auth):
+        if not verified:
+            config = current_app.config
+            verified.append(TTLCache(config.get('HTTP_AUTH_CACHE_SIZE', 1024),
+                                     config.get('HTTP_AUTH_CACHE_TTL', 300)))
+        cache = verified[0]
+        key = hmac.new(current_app.secret_key.encode('utf-8'), header.encode('utf-8'),
+                       hashlib.sha256).hexdigest()
+        if cache.get(key):
+            return True
+        import config
+        if auth.username == username and config.bcrypt.check_password_hash(password_hash,
+                                                                            auth.password):
+            cache.set(key, True)
+            return True
+        return False
+
     def protected():
-        if request and request.endpoint and not request.endpoint.startswith('_'):
-            if include:
-                predicate = request.endpoint in endpoints
-            else:
-                predicate = request.endpoint not in endpoints
-            if predicate:
-                auth = request.authorization
-                if not auth or not (auth.username == username and auth.password == password):
-                    return Response('Could not verify your access level for that URL.\n'
-                                    'You have to login with proper credentials', 401,
-                                    {'WWW-Authenticate': 'Basic realm="Login Required"'})
+        if request and request.endpoint and is_protected(request.endpoint):
+            auth = request.authorization
+            if not auth or not check(request.headers.get('Authorization', ''), auth):
+                return Response('Could not verify your access level for that URL.\n'
+                                'You have to login with proper credentials', 401,
+                                {'WWW-Authenticate': 'Basic realm="Login Required"'})
     return protected
 
-def http_do_auth(username, password, *endpoints):
-    return http_auth(username, password, True, *endpoints)
+def http_do_auth(username, password_hash, *endpoints):
+    return http_auth(username, password_hash, True, *endpoints)
 
-def http_dont_auth(username, password, *endpoints):
-    return http_auth(username, password, False, *endpoints)
+def http_dont_auth(username, password_hash, *endpoints):
+    return http_auth(username, password_hash, False, *endpoints)
 
 def row_to_dict(row):
     return dict((col, getattr(row, col)) for col in row.__table__.columns.keys())
 
 def rows_to_dict(rows):
     return map(row_to_dict, rows)
+
+def project_columns(table, fields=None):
+    """
+    Columns of `table` named in the comma separated `fields`, in table order.
+    All columns when `fields` is empty. Primary key columns are always
+    included. Raises `ValueError` on unknown field names.
+    """
+    if not fields:
+        return list(table.columns)
+    names = set(name.strip() for name in fields.split(',') if name.strip())
+    unknown = names - set(table.columns.keys())
+    if unknown:
+        raise ValueError('Unknown fields: %s' % ', '.join(sorted(unknown)))
+    return [col for col in table.columns if col.key in names or col.primary_key]
+
+def tuples_to_dict(keys, rows):
+    """
+    Converts Core result `rows` to dicts keyed by the precomputed `keys`,
+    without hydrating ORM objects.
+    """
+    return [dict(zip(keys, row)) for row in rows]
+
+class LazyExtension(object):
+    """
+    Stands in for a flask extension, creating it with `factory(app)` on
+    first attribute access.
+    """
+    def __init__(self, factory, app):
+        self.__dict__['_factory'] = factory
+        self.__dict__['_app'] = app
+        self.__dict__['_lock'] = threading.Lock()
+        self.__dict__['_obj'] = None
+
+    @classmethod
+    def wrap(cls, init_fn, lazy):
+        """
+        `init_fn` itself, or a function installing a lazy stand in for the
+        object it returns under the same `config` attribute when `lazy`.
+        """
+        if not lazy:
+            return init_fn
+        def init_lazy(app):
+            import config
+            setattr(config, init_fn.__name__[len('init_'):], cls(init_fn, app))
+        return init_lazy
+
+    def _get(self):
+        obj = self.__dict__['_obj']
+        if obj is None:
+            with self._lock:
+                obj = self.__dict__['_obj']
+                if obj is None:
+                    obj = self.__dict__['_obj'] = self._factory(self._app)
+        return obj
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
+
+
+class LazyCommandGroup(AppGroup):
+    """
+    `app.cli` group importing the module registering the commands only when
+    a command is looked up or listed.
+    """
+    def __init__(self, name, module_name):
+        super(LazyCommandGroup, self).__init__(name)
+        self.module_name = module_name
+        self.loaded = False
+
+    def load(self):
+        if not self.loaded:
+            self.loaded = True
+            __import__(self.module_name)
+
+    def get_command(self, ctx, name):
+        self.load()
+        return super(LazyCommandGroup, self).get_command(ctx, name)
+
+    def list_commands(self, ctx):
+        self.load()
+        return super(LazyCommandGroup, self).list_commands(ctx)
+
+_hashed_asset = re.compile(r'^dist/.+\.[0-9a-f]{8,}\.[a-z0-9]+$')
+
+def immutable_assets(response):
+    """
+    After request handler marking content hashed static files under
+    `static/dist` (see `flask assets_build`) as cacheable forever.
+    """
+    from flask import request, current_app
+    if (request.endpoint == 'static' and response.status_code == 200 and
+            _hashed_asset.match((request.view_args or {}).get('filename', ''))):
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % \
+            current_app.config.get('ASSETS_MAX_AGE', 31536000)
+        response.headers.pop('Expires', None)
+    return response
+
+def private_directory(path):
+    """
+    Creates the directory `path` with mode 0700, or checks an existing one.
+    Raises `RuntimeError` if it isn't a directory owned by the current user
+    or if others can write to it: the app loads code (compiled templates)
+    and data from such directories.
+    """
+    import os
+    import stat
+    try:
+        os.makedirs(path, 0o700)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    info = os.lstat(path)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+            or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+        raise RuntimeError('%s must be a directory owned by the current user and not '
+                           'writable by others.' % path)
+    return path
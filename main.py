@@ -4,67 +4,181 @@ Implements the main WSGI app. It instantiates and sets it up. It can
 be run stand-alone as a flask application or it can be imported and
 the resulting `app` object be used.
 """
-import glob
+import time
 
 from flask import Flask
 from flask import Blueprint
 from werkzeug import import_string
-from flask_bcrypt import Bcrypt
-from flask_babel import Babel
-from flask_cache import Cache
-from flask_sqlalchemy import SQLAlchemy
-from flask_assets import Environment
-from flask_debugtoolbar import DebugToolbarExtension
-import webassets.loaders
 
 
 import config
 import config.urls as urls
 import config.settings as settings
+from lib.utils import LazyExtension, LazyCommandGroup
+from lib.static import set_static_views
 
 
 def init():
     """
     Sets up flask application object `app` and returns it.
+
+    With `LAZY_STARTUP` set, rarely used extensions are created on first use
+    and assets are registered on the first request. The time taken by each
+    step, imports included, is kept in `app.startup_timings`.
     """
+    timings = []
+    start = time.time()
     # Instantiate main app, load configs, register modules, set
     # url patterns and return the `app` object.
     app = Flask(__name__)
     app.config.from_object(settings)
     config.app = app
-    # Init SQLAlchemy wrapper.
-    config.db = SQLAlchemy(app)
-    if app.debug:
-        DebugToolbarExtension(app)
-    #: Wrap the `app` with `Babel` for i18n.
-    Babel(app)
+    # Set flask-cli commands. They are only imported when the CLI asks for them.
+    app.cli = LazyCommandGroup(app.name, 'commands')
+    timings.append(('flask', time.time() - start))
+
+    lazy = app.config.get('LAZY_STARTUP', False)
+    for name, fn in [('jinja', init_jinja),
+                     ('sqlalchemy', init_db),
+                     ('debugtoolbar', init_debug_toolbar),
+                     ('babel', init_babel),
+                     ('cache', LazyExtension.wrap(init_cache, lazy)),
+                     ('bcrypt', LazyExtension.wrap(init_bcrypt, lazy))]:
+        start = time.time()
+        fn(app)
+        timings.append((name, time.time() - start))
 
-    config.cache = Cache(app)
-    config.bcrypt = Bcrypt(app)
     # Other initializations.
     for fn, values in [(set_middlewares, getattr(settings, 'MIDDLEWARES', None)),
                        (set_context_processors, getattr(settings, 'CONTEXT_PROCESSORS', None)),
                        (set_template_filters, getattr(settings, 'TEMPLATE_FILTERS', None)),
+                       (set_jinja_extensions, getattr(settings, 'JINJA_EXTENSIONS', None)),
                        (set_before_handlers, getattr(settings, 'BEFORE_REQUESTS', None)),
                        (set_after_handlers, getattr(settings, 'AFTER_REQUESTS', None)),
                        (set_log_handlers, getattr(settings, 'LOG_HANDLERS', None)),
                        (set_error_handlers, getattr(settings, 'ERROR_HANDLERS', None)),
                        (set_blueprints, getattr(settings, 'BLUEPRINTS', None))]:
         if values:
+            start = time.time()
             fn(app, values)
+            timings.append((fn.__name__, time.time() - start))
 
-    # Register all js and css files.
-    assets = Environment(app)
-    for name, bundle in webassets.loaders.YAMLLoader('assets.yml').load_bundles().items():
-        assets.register(name, bundle)
-
+    start = time.time()
+    init_assets(app, lazy)
     # URL rules.
     urls.set_urls(app)
-    # Set flask-cli commands
-    import commands
+    # Serve static files from their precompressed variants.
+    set_static_views(app)
+    timings.append(('assets_and_urls', time.time() - start))
+    if app.config.get('TEMPLATES_PRELOAD'):
+        start = time.time()
+        preload_templates(app)
+        timings.append(('templates', time.time() - start))
+    app.startup_timings = timings
     return app
 
 
+def init_jinja(app):
+    """
+    Keeps compiled templates in `JINJA_BYTECODE_CACHE_DIR`, shared by all
+    workers and kept across restarts. The directory must belong to the
+    user running the app, see :func:`lib.utils.private_directory`.
+    """
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if directory:
+        from jinja2 import FileSystemBytecodeCache
+        from lib.utils import private_directory
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(private_directory(directory))
+
+
+def preload_templates(app):
+    """
+    Loads every app and blueprint template into the jinja environment. Run
+    before forking, workers share them. Returns the names of the templates
+    that failed to compile.
+    """
+    failed = []
+    for name in app.jinja_env.list_templates(extensions=app.config.get('TEMPLATES_EXTENSIONS')):
+        try:
+            app.jinja_env.get_template(name)
+        except Exception:
+            app.logger.exception('Failed to compile template %s', name)
+            failed.append(name)
+    return failed
+
+
+def init_db(app):
+    """
+    Inits SQLAlchemy wrapper. Pool options come from
+    `SQLALCHEMY_ENGINE_OPTIONS`, read replicas from `SQLALCHEMY_REPLICA_URIS`.
+    """
+    from lib.db import RoutingSQLAlchemy, register_replicas
+    register_replicas(app)
+    config.db = RoutingSQLAlchemy(app)
+
+
+def init_debug_toolbar(app):
+    """
+    Enables the debug toolbar in debug mode. It isn't imported otherwise.
+    """
+    if app.debug:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+
+def init_babel(app):
+    """
+    Wraps the `app` with `Babel` for i18n.
+    """
+    from flask_babel import Babel
+    Babel(app)
+
+
+def init_cache(app):
+    from flask_cache import Cache
+    # `{% cache %}` is provided by `lib.template_cache` instead.
+    config.cache = Cache(app, with_jinja2_ext=False)
+    return config.cache
+
+
+def init_bcrypt(app):
+    from flask_bcrypt import Bcrypt
+    config.bcrypt = Bcrypt(app)
+    return config.bcrypt
+
+
+def init_assets(app, lazy=False):
+    """
+    Registers all js and css files from `assets.yml`. When `lazy`, the file
+    is only parsed before the first request.
+    """
+    from flask_assets import Environment
+    assets = Environment(app)
+    if lazy:
+        app.before_first_request(lambda: register_bundles(assets))
+    else:
+        register_bundles(assets)
+
+
+def register_bundles(assets):
+    """
+    Registers the bundles from `assets.yml` with the `assets` environment,
+    unless that's already done.
+    """
+    if len(assets):
+        return
+    for name, bundle in load_bundles().items():
+        assets.register(name, bundle)
+
+
+def load_bundles():
+    """
+    The bundles defined in `assets.yml`, by name.
+    """
+    import webassets.loaders
+    return webassets.loaders.YAMLLoader('assets.yml').load_bundles()
+
+
 def set_middlewares(app, middlewares):
     """
     Adds middlewares to the app.
@@ -98,7 +212,8 @@ def set_blueprints(app, blueprints):
         url_prefix = None
         if len(blueprint) == 2:
             blueprint, url_prefix = blueprint
-        blueprint_object = import_string('%s:BLUEPRINT' % blueprint, silent=True)
+        module = import_string(blueprint)
+        blueprint_object = getattr(module, 'BLUEPRINT', None)
         blueprint_name, blueprint_import_name = blueprint.split('.')[-1], blueprint
         if not blueprint_object:
             options = dict(static_folder='static', template_folder='templates')
@@ -108,14 +223,8 @@ def set_blueprints(app, blueprints):
             urls.set_urls(blueprint_object, blueprint_routes)
 
         # Other initializations.
-        for fn, values in [(set_before_handlers, import_string('%s:BEFORE_REQUESTS' % blueprint, silent=True)),
-                           (set_before_app_handlers, import_string('%s:BEFORE_APP_REQUESTS' % blueprint, silent=True)),
-                           (set_after_handlers, import_string('%s:AFTER_REQUESTS' % blueprint, silent=True)),
-                           (set_after_app_handlers, import_string('%s:AFTER_APP_REQUESTS' % blueprint, silent=True)),
-                           (set_context_processors, import_string('%s:CONTEXT_PROCESSORS' % blueprint, silent=True)),
-                           (set_app_context_processors, import_string('%s:APP_CONTEXT_PROCESSORS' % blueprint, silent=True)),
-                           (set_error_handlers, import_string('%s:ERROR_HANDLERS' % blueprint, silent=True)),
-                           (set_app_error_handlers, import_string('%s:APP_ERROR_HANDLERS' % blueprint, silent=True))]:
+        for attr, fn in BLUEPRINT_HOOKS:
+            values = getattr(module, attr, None)
             if values:
                 fn(blueprint_object, values)
         # Can be mounted at specific prefix.
@@ -180,6 +289,14 @@ def set_template_filters(app, template_filters):
         app.jinja_env.filters[filter_name] = filter_fn
 
 
+def set_jinja_extensions(app, extensions):
+    """
+    Adds jinja2 extensions, given as classes or import paths.
+    """
+    for extension in extensions:
+        app.jinja_env.add_extension(extension)
+
+
 def set_context_processors(app, context_processors):
     """
     Sets jinja2 context processors.
@@ -211,6 +328,16 @@ def set_app_error_handlers(app, error_handlers):
     for code, fn in error_handlers:
         fn = app.app_errorhandler(code)(fn)
 
+#: Blueprint package attributes and the functions registering them.
+BLUEPRINT_HOOKS = [('BEFORE_REQUESTS', set_before_handlers),
+                   ('BEFORE_APP_REQUESTS', set_before_app_handlers),
+                   ('AFTER_REQUESTS', set_after_handlers),
+                   ('AFTER_APP_REQUESTS', set_after_app_handlers),
+                   ('CONTEXT_PROCESSORS', set_context_processors),
+                   ('APP_CONTEXT_PROCESSORS', set_app_context_processors),
+                   ('ERROR_HANDLERS', set_error_handlers),
+                   ('APP_ERROR_HANDLERS', set_app_error_handlers)]
+
 app = init()
 if __name__ == '__main__':
     #: Create the `app` object via :func:`init`. Run the `app`
@@ -0,0 +1,22 @@
+"""Index comment.post_id.
+
+Revision ID: 3f1c9a7d2b40
+Revises: 2dedad1c5f6
+Create Date: 2026-10-17 10:12:04.118372
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b40'
+down_revision = '2dedad1c5f6'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_comment_post_id', 'comment', ['post_id'])
+
+
+def downgrade():
+    op.drop_index('ix_comment_post_id', 'comment')
@@ -0,0 +1,33 @@
+"""Add version and updated_at to post and comment.
+
+Revision ID: 4a7e0b5c91d2
+Revises: 3f1c9a7d2b40
+Create Date: 2026-10-17 11:02:47.530194
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4a7e0b5c91d2'
+down_revision = '3f1c9a7d2b40'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    for table in ('post', 'comment'):
+        op.add_column(table, sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+        # SQLite can't add a column with a non-constant default: add it
+        # nullable, fill it in, then set the default and NOT NULL.
+        op.add_column(table, sa.Column('updated_at', sa.DateTime()))
+        op.execute(sa.table(table, sa.column('updated_at'))
+                   .update().values(updated_at=sa.func.current_timestamp()))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False,
+                                  server_default=sa.func.current_timestamp())
+
+
+def downgrade():
+    for table in ('post', 'comment'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,112 @@
+"""Add the post_search full-text index.
+
+Revision ID: 5b2d8e6f0a13
+Revises: 4a7e0b5c91d2
+Create Date: 2026-10-17 14:20:31.402118
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5b2d8e6f0a13'
+down_revision = '4a7e0b5c91d2'
+
+from alembic import op
+
+
+# One row per post and one per comment: a write re-indexes only its own row.
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE post_search USING fts5("
+    "title, content, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE VIRTUAL TABLE comment_search USING fts5("
+    "body, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER post_search_ai AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_search (rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER post_search_au AFTER UPDATE OF title, content ON post BEGIN "
+    "UPDATE post_search SET title = new.title, content = new.content WHERE rowid = new.id; END",
+    "CREATE TRIGGER post_search_ad AFTER DELETE ON post BEGIN "
+    "DELETE FROM post_search WHERE rowid = old.id; END",
+    "CREATE TRIGGER comment_search_ai AFTER INSERT ON comment BEGIN "
+    "INSERT INTO comment_search (rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER comment_search_au AFTER UPDATE OF body ON comment BEGIN "
+    "UPDATE comment_search SET body = new.body WHERE rowid = new.id; END",
+    "CREATE TRIGGER comment_search_ad AFTER DELETE ON comment BEGIN "
+    "DELETE FROM comment_search WHERE rowid = old.id; END",
+    "INSERT INTO post_search (rowid, title, content) SELECT id, title, content FROM post",
+    "INSERT INTO comment_search (rowid, body) SELECT id, body FROM comment",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS comment_search_ad",
+    "DROP TRIGGER IF EXISTS comment_search_au",
+    "DROP TRIGGER IF EXISTS comment_search_ai",
+    "DROP TRIGGER IF EXISTS post_search_ad",
+    "DROP TRIGGER IF EXISTS post_search_au",
+    "DROP TRIGGER IF EXISTS post_search_ai",
+    "DROP TABLE IF EXISTS comment_search",
+    "DROP TABLE IF EXISTS post_search",
+]
+
+POSTGRES_UPGRADE = [
+    "CREATE TABLE post_search ("
+    "post_id integer PRIMARY KEY REFERENCES post (id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL)",
+    "CREATE TABLE comment_search ("
+    "comment_id integer PRIMARY KEY REFERENCES comment (id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL)",
+    """CREATE FUNCTION post_search_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'post' THEN
+        INSERT INTO post_search (post_id, document)
+        VALUES (NEW.id, setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                        setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B'))
+        ON CONFLICT (post_id) DO UPDATE SET document = excluded.document;
+    ELSE
+        INSERT INTO comment_search (comment_id, document)
+        VALUES (NEW.id, setweight(to_tsvector('english', coalesce(NEW.body, '')), 'C'))
+        ON CONFLICT (comment_id) DO UPDATE SET document = excluded.document;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql""",
+    # Backfill before indexing, building the GIN indexes once is cheaper.
+    """INSERT INTO post_search (post_id, document)
+    SELECT id, setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+               setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    FROM post""",
+    """INSERT INTO comment_search (comment_id, document)
+    SELECT id, setweight(to_tsvector('english', coalesce(body, '')), 'C')
+    FROM comment""",
+    "CREATE INDEX ix_post_search_document ON post_search USING gin (document)",
+    "CREATE INDEX ix_comment_search_document ON comment_search USING gin (document)",
+    "CREATE TRIGGER post_search_update AFTER INSERT OR UPDATE OF title, content ON post "
+    "FOR EACH ROW EXECUTE PROCEDURE post_search_trigger()",
+    "CREATE TRIGGER comment_search_update AFTER INSERT OR UPDATE OF body ON comment "
+    "FOR EACH ROW EXECUTE PROCEDURE post_search_trigger()",
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS comment_search_update ON comment",
+    "DROP TRIGGER IF EXISTS post_search_update ON post",
+    "DROP FUNCTION IF EXISTS post_search_trigger()",
+    "DROP TABLE IF EXISTS comment_search",
+    "DROP TABLE IF EXISTS post_search",
+]
+
+
+def _statements(sqlite, postgres):
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite
+    if dialect == 'postgresql':
+        return postgres
+    raise NotImplementedError('Full-text search is not supported on %s.' % dialect)
+
+
+def upgrade():
+    for statement in _statements(SQLITE_UPGRADE, POSTGRES_UPGRADE):
+        op.execute(statement)
+
+
+def downgrade():
+    for statement in _statements(SQLITE_DOWNGRADE, POSTGRES_DOWNGRADE):
+        op.execute(statement)
@@ -0,0 +1,45 @@
+"""Add comment_count and last_commented_at to post.
+
+Revision ID: 6e4a1c2b9d57
+Revises: 5b2d8e6f0a13
+Create Date: 2026-10-17 15:05:12.774390
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6e4a1c2b9d57'
+down_revision = '5b2d8e6f0a13'
+
+from alembic import op
+import sqlalchemy as sa
+
+#: Posts backfilled per transaction, to keep each one's locks short.
+CHUNK_SIZE = 5000
+
+
+def upgrade():
+    op.add_column('post', sa.Column('comment_count', sa.Integer(), nullable=False,
+                                    server_default='0'))
+    op.add_column('post', sa.Column('last_commented_at', sa.DateTime(), nullable=True))
+    # Finds the latest comment of a post for the backfill and for deletes,
+    # and covers the lookups ix_comment_post_id served.
+    op.create_index('ix_comment_post_id_updated_at', 'comment', ['post_id', 'updated_at'])
+    op.drop_index('ix_comment_post_id', 'comment')
+    conn = op.get_bind()
+    max_id = conn.execute(sa.text('SELECT max(id) FROM post')).scalar() or 0
+    backfill = sa.text(
+        'UPDATE post SET '
+        'comment_count = (SELECT count(*) FROM comment WHERE comment.post_id = post.id), '
+        'last_commented_at = (SELECT max(updated_at) FROM comment WHERE comment.post_id = post.id) '
+        'WHERE id > :low AND id <= :high')
+    # Outside the migration's transaction, each chunk commits on its own.
+    with op.get_context().autocommit_block():
+        for low in range(0, max_id, CHUNK_SIZE):
+            conn.execute(backfill, low=low, high=low + CHUNK_SIZE)
+
+
+def downgrade():
+    op.create_index('ix_comment_post_id', 'comment', ['post_id'])
+    op.drop_index('ix_comment_post_id_updated_at', 'comment')
+    op.drop_column('post', 'last_commented_at')
+    op.drop_column('post', 'comment_count')
@@ -0,0 +1,89 @@
+"""
+Serialization cost of the JSON API, per row.
+
+    python -m script.bench_api [--rows 1000] [--repeat 5] [--database sqlite://]
+
+Fills a scratch database (in memory by default) with `--rows` posts and
+reports microseconds per row for:
+
+- ``serialize-*``: turning already fetched rows into JSON, from ORM objects
+  with `row_to_dict` and from Core tuples with `tuples_to_dict`, as the API
+  does.
+- ``fetch+serialize-*``: the same including the query.
+- ``endpoint-*``: full requests to the API through the test client, a
+  ``per_page`` page and the whole table as NDJSON.
+"""
+import argparse
+import sys
+import time
+
+import main
+from lib.utils import rows_to_dict, tuples_to_dict, project_columns
+
+
+def per_row(fn, rows, repeat):
+    """
+    Best microseconds per row of `repeat` calls of `fn`.
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) / rows * 1e6
+
+
+def fill(db, table, count):
+    db.session.execute(table.delete())
+    db.session.execute(table.insert(), [dict(name='name%s' % i, title='Post title %s' % i,
+                                             content='Some content for post %s. ' % i * 4)
+                                        for i in range(count)])
+    db.session.commit()
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description='JSON API serialization benchmarks.')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database', default='sqlite://',
+                        help='Scratch database; its post and comment tables are recreated.')
+    args = parser.parse_args(argv)
+    app = main.app
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    app.config['SQLALCHEMY_ECHO'] = False
+    from config import db
+    from blueprints.post import api, models
+    table = models.Post.__table__
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        fill(db, table, args.rows)
+        columns = project_columns(table)
+        keys = [col.key for col in columns]
+        stmt = db.select(columns).order_by(table.c.id)
+        objects = models.Post.query.order_by(models.Post.id).all()
+        tuples = db.session.execute(stmt).fetchall()
+        encode = api._encoder.encode
+        cases = [
+            ('serialize-orm', lambda: encode(list(rows_to_dict(objects)))),
+            ('serialize-core', lambda: encode(tuples_to_dict(keys, tuples))),
+            ('fetch+serialize-orm', lambda: encode(list(rows_to_dict(
+                models.Post.query.order_by(models.Post.id).all())))),
+            ('fetch+serialize-core', lambda: encode(tuples_to_dict(
+                keys, db.session.execute(stmt).fetchall()))),
+        ]
+        results = [(name, per_row(fn, args.rows, args.repeat)) for name, fn in cases]
+        db.session.remove()
+    client = app.test_client()
+    per_page = min(args.rows, app.config.get('PAGINATION_MAX_PER_PAGE', 100))
+    for name, url, rows in [('endpoint-page', '/posts/api?per_page=%s' % per_page, per_page),
+                            ('endpoint-ndjson', '/posts/api?format=ndjson', args.rows)]:
+        results.append((name, per_row(lambda: client.get(url).get_data(), rows, args.repeat)))
+    for name, us in results:
+        print('%-24s %10.3f us/row' % (name, us))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
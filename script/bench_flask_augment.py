@@ -0,0 +1,44 @@
+"""
+Microbenchmark for the per-request overhead of `lib.flask_augment` decorators.
+
+    python -m script.bench_flask_augment [number]
+"""
+import sys
+import timeit
+
+from flask import Flask
+
+from lib.flask_augment import ensure_args, ensure_one_of, validate_many
+
+RULES = dict(id=r'\d+$', name=(lambda val: val and len(val) < 20, 'Name too long.'),
+             email=(r'[^@]+@[^@]+$', 'Invalid email.'))
+ARGS = 'id=42&name=redux&email=admin@example.com'
+
+
+def view():
+    return 'ok'
+
+
+def run(number=100000):
+    app = Flask(__name__)
+    handler = lambda errors: errors
+    cases = [
+        ('bare view', view),
+        ('ensure_args', ensure_args(error_handler=handler, **RULES)(view)),
+        ('ensure_one_of', ensure_one_of(error_handler=handler, **RULES)(view)),
+    ]
+    with app.test_request_context('/?%s' % ARGS):
+        baseline = None
+        for name, fn in cases:
+            per_call = min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+            if baseline is None:
+                baseline = per_call
+            print('%-16s %8.3f us/call  (+%.3f us)' % (name, per_call, per_call - baseline))
+    payloads = [dict(id=str(i), name='user%s' % i, email='u%s@example.com' % i) for i in range(1000)]
+    per_payload = min(timeit.repeat(lambda: validate_many(payloads, **RULES),
+                                    number=max(1, number // 1000), repeat=3)) / max(1, number // 1000) / 1000 * 1e6
+    print('%-16s %8.3f us/payload' % ('validate_many', per_payload))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
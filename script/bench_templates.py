@@ -0,0 +1,212 @@
+"""
+Rendering benchmarks for the post templates, with synthetic data.
+
+    python -m script.bench_templates [--posts 10,1000,100000] [--comments 0,100,10000]
+                                     [--repeat 5] [--output results.json]
+                                     [--baseline baseline.json] [--threshold 10]
+
+Renders `post/index.jinja2` and `post/show.jinja2` through `render_template`
+without touching the DB, and reports for each case the best and median
+render time, the peak memory allocated while rendering (tracemalloc) and
+the output size. The ``no-url_for`` variants stub `url_for` out, and the
+``fragments-warm`` ones of the show page, the only one with `{% cache %}`
+fragments, render with them already stored, to show what those cost. `url_for`, `flashed()` and
+`render_field()` are also timed on their own.
+
+`--output` writes the results as JSON; pass such a file as `--baseline`
+to compare against it. The exit status is 1 when any case got slower than
+`--threshold` percent.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+import jinja2
+from flask import render_template, render_template_string, flash
+
+import config
+import main
+from lib.pagination import KeysetPage
+
+
+def make_posts(count):
+    now = datetime(2026, 1, 1)
+    return [SimpleNamespace(id=i, name='name%s' % i, title='Post title %s' % i,
+                            content='Some content for post %s. ' % i * 4, version=1,
+                            comment_count=i % 50, last_commented_at=now)
+            for i in range(1, count + 1)]
+
+
+def make_comments(count):
+    return [SimpleNamespace(id=i, commenter='commenter%s' % i, body='Comment body %s. ' % i * 3)
+            for i in range(1, count + 1)]
+
+
+def measure(render, repeat):
+    """
+    Best and median seconds of `repeat` calls of `render`, the peak bytes it
+    allocates and its output size.
+    """
+    output = render()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    tracemalloc.start()
+    try:
+        render()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return dict(seconds=times[0], median_seconds=times[len(times) // 2], peak_bytes=peak,
+                output_bytes=len(output.encode('utf-8')))
+
+
+class _Variant(object):
+    """
+    Renders with `url_for` stubbed out and/or the fragment cache disabled.
+    """
+    def __init__(self, app, url_for=True, fragments=False):
+        self.app = app
+        self.url_for = url_for
+        self.fragments = fragments
+
+    def __enter__(self):
+        self.globals = dict(self.app.jinja_env.globals)
+        self.cache = getattr(config, 'cache', None)
+        if not self.url_for:
+            self.app.jinja_env.globals['url_for'] = lambda *args, **kwargs: '#'
+        if not self.fragments:
+            config.cache = None
+        elif self.cache is not None:
+            self.cache.clear()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.app.jinja_env.globals.clear()
+        self.app.jinja_env.globals.update(self.globals)
+        config.cache = self.cache
+
+
+def page_cases(app, posts_sizes, comments_sizes, repeat):
+    from blueprints.post.forms import CommentForm
+    results = {}
+    variants = [('', dict()), ('-no-url_for', dict(url_for=False))]
+    for count in posts_sizes:
+        posts = make_posts(count)
+        page = KeysetPage(posts, count, next_cursor=count)
+        with app.test_request_context('/posts/'):
+            for suffix, options in variants:
+                with _Variant(app, **options):
+                    results['index-%sposts%s' % (count, suffix)] = measure(
+                        lambda: render_template('post/index.jinja2', object_list=page, page=page),
+                        repeat)
+    post = make_posts(1)[0]
+    for count in comments_sizes:
+        comments = KeysetPage(make_comments(count), max(count, 1))
+        with app.test_request_context('/posts/%s' % post.id):
+            form = CommentForm()
+            for suffix, options in variants + [('-fragments-warm', dict(fragments=True))]:
+                with _Variant(app, **options):
+                    results['show-%scomments%s' % (count, suffix)] = measure(
+                        lambda: render_template('post/show.jinja2', post=post, form=form,
+                                                comments=comments),
+                        repeat)
+    return results
+
+
+def helper_cases(app, repeat, calls=1000):
+    """
+    Per call cost of the helpers used by the page templates.
+    """
+    from blueprints.post.forms import CommentForm
+    results = {}
+    loop = '{%% for i in range(%s) %%}%s{%% endfor %%}'
+    cases = [
+        ('url_for', '{{ url_for("post.show", id=i) }}', None),
+        ('flashed', '{{ flashed() }}', 10),
+        ('render_field', '{{ render_field(form.body) }}', None),
+        ('render_field-errors', '{{ render_field(form.body) }}', 'errors'),
+    ]
+    for name, body, setup in cases:
+        with app.test_request_context('/posts/', method='POST'):
+            form = CommentForm()
+            if setup == 'errors':
+                form.validate()
+            elif setup:
+                for i in range(setup):
+                    flash('Message %s' % i, 'info')
+            source = ('{% from "helpers.jinja2" import flashed, render_field %}' +
+                      loop % (calls, body))
+            with _Variant(app):
+                result = measure(lambda: render_template_string(source, form=form), repeat)
+            for key in ('seconds', 'median_seconds'):
+                result[key] /= calls
+            results['helper-%s' % name] = result
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints each case next to its baseline. Returns the cases slower than
+    `threshold` percent.
+    """
+    slower = []
+    print('%-32s %12s %12s %8s %12s %12s' % ('case', 'seconds', 'baseline', 'change',
+                                             'peak bytes', 'output'))
+    for name in sorted(results):
+        result = results[name]
+        base = baseline.get(name)
+        if base:
+            change = (result['seconds'] - base['seconds']) / base['seconds'] * 100
+            if change > threshold:
+                slower.append(name)
+            base_text, change_text = '%.6f' % base['seconds'], '%+.1f%%' % change
+        else:
+            base_text = change_text = '-'
+        print('%-32s %12.6f %12s %8s %12d %12d' % (name, result['seconds'], base_text, change_text,
+                                                   result['peak_bytes'], result['output_bytes']))
+    return slower
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description='Template rendering benchmarks.')
+    parser.add_argument('--posts', default='10,1000,100000')
+    parser.add_argument('--comments', default='0,100,10000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--baseline', help='Compare with the results in this JSON file.')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent slower than the baseline that fails the run.')
+    args = parser.parse_args(argv)
+    app = main.app
+    results = page_cases(app, [int(n) for n in args.posts.split(',') if n],
+                         [int(n) for n in args.comments.split(',') if n], args.repeat)
+    results.update(helper_cases(app, args.repeat))
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    slower = compare(results, baseline, args.threshold)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(meta=dict(python=platform.python_version(), jinja2=jinja2.__version__,
+                                     platform=platform.platform(),
+                                     created=datetime.utcnow().isoformat(), repeat=args.repeat),
+                           results=results),
+                      f, indent=2, sort_keys=True)
+    if slower:
+        print('Slower than baseline by more than %s%%: %s' % (args.threshold, ', '.join(slower)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,189 @@
+"""
+Prefork supervisor: runs an already loaded app in several worker processes.
+
+Each worker binds its own ``SO_REUSEPORT`` socket on the same port, so the
+kernel spreads connections across them. The master restarts workers that
+die, replaces them one by one on SIGHUP (a new worker is started and ready
+before the old one is asked to stop) and stops them all on SIGTERM/SIGINT.
+
+The app is imported once in the master, so SIGHUP recycles workers but
+does not pick up new code; restart the master for that.
+"""
+import errno
+import importlib
+import os
+import select
+import shutil
+import signal
+import socket
+import sys
+import time
+
+#: Supported engines and their runner modules.
+ENGINES = {
+    'gevent': 'script.serve_app_gevent',
+    'tornado': 'script.serve_app_tornado',
+}
+
+
+class Master(object):
+    def __init__(self, app, engine='gevent', port=8080, workers=None, backlog=2048,
+                 graceful_timeout=None):
+        self.app = app
+        self.engine = engine
+        self.runner_name = ENGINES[engine]
+        self.port = port
+        self.num_workers = workers or os.cpu_count() or 1
+        self.backlog = backlog
+        self.graceful_timeout = graceful_timeout if graceful_timeout is not None else \
+            app.config.get('GRACEFUL_TIMEOUT', 30)
+        #: pid -> start time of the workers that should be running.
+        self.workers = {}
+        self.reload = False
+        self.stopping = False
+
+    def run(self):
+        self._reset_metrics()
+        signal.signal(signal.SIGHUP, self._on_hup)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        for _ in range(self.num_workers):
+            self.spawn()
+        self.log('Master %s serving on port %s with %s %s workers.'
+                 % (os.getpid(), self.port, self.num_workers, self.engine))
+        while not self.stopping:
+            self.reap()
+            if self.reload:
+                self.reload = False
+                self.rolling_restart()
+            time.sleep(0.2)
+        self.stop_all()
+
+    def spawn(self):
+        """
+        Forks a worker and waits until its socket is listening.
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                self._worker(write_fd)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                os._exit(1)
+            os._exit(0)
+        os.close(write_fd)
+        ready, _, _ = select.select([read_fd], [], [], 30)
+        os.close(read_fd)
+        if not ready:
+            self.log('Worker %s did not start listening in time.' % pid)
+        self.workers[pid] = time.time()
+        return pid
+
+    def _worker(self, ready_fd):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        import config
+        # Connections opened by the master must not be shared.
+        with self.app.app_context():
+            config.db.get_engine(self.app).dispose()
+        sock = self._listen()
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+        runner = importlib.import_module(self.runner_name)
+        runner.run_server(self.app, self.port, sock=sock)
+
+    def _listen(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', self.port))
+        sock.listen(self.backlog)
+        sock.setblocking(False)
+        return sock
+
+    def reap(self):
+        """
+        Collects exited workers and replaces the ones that weren't asked to stop.
+        """
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as ex:
+                if ex.errno == errno.ECHILD:
+                    return
+                raise
+            if not pid:
+                return
+            started = self.workers.pop(pid, None)
+            if started is not None and not self.stopping:
+                self.log('Worker %s exited with status %s, restarting.' % (pid, status))
+                if time.time() - started < 1:
+                    # Don't spin on a worker failing at startup.
+                    time.sleep(1)
+                self.spawn()
+
+    def rolling_restart(self):
+        self.log('Rolling restart of %s workers.' % len(self.workers))
+        for pid in list(self.workers):
+            self.spawn()
+            self.workers.pop(pid, None)
+            self._terminate(pid)
+
+    def stop_all(self):
+        pids = list(self.workers)
+        self.workers.clear()
+        for pid in pids:
+            self._signal(pid, signal.SIGTERM)
+        for pid in pids:
+            self._wait(pid)
+        self.log('Master %s stopped.' % os.getpid())
+
+    def _terminate(self, pid):
+        self._signal(pid, signal.SIGTERM)
+        self._wait(pid)
+
+    def _wait(self, pid):
+        deadline = time.time() + self.graceful_timeout
+        while time.time() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except OSError:
+                return
+            if done:
+                return
+            time.sleep(0.1)
+        self.log('Worker %s did not stop in %ss, killing it.' % (pid, self.graceful_timeout))
+        self._signal(pid, signal.SIGKILL)
+        try:
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+    def _reset_metrics(self):
+        # Per worker metrics files are only meaningful for this server run.
+        directory = self.app.config.get('METRICS_DIR')
+        if directory and os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _on_hup(self, signum, frame):
+        self.reload = True
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def log(self, message):
+        sys.stderr.write('[prefork] %s\n' % message)
+        sys.stderr.flush()
+
+
+def run(app, engine='gevent', port=8080, workers=None, backlog=2048, graceful_timeout=None):
+    Master(app, engine, port, workers, backlog, graceful_timeout).run()
@@ -1,9 +1,36 @@
 from gevent.monkey import patch_all
 patch_all()
 
-def run_server(app, port=8080):
+def run_server(app, port=8080, sock=None):
+    """
+    Serves `app` on `port`, or on the already listening socket `sock`.
+    Requests run in a pool of `GEVENT_POOL_SIZE` greenlets, see
+    :mod:`lib.green`. SIGTERM stops accepting connections and waits up to
+    `GRACEFUL_TIMEOUT` seconds for running requests.
+    """
+    import signal
+    import gevent
+    from gevent.pool import Pool
     from gevent.pywsgi import WSGIServer
-    http_server = WSGIServer(('', port), app)
+    from lib.db import warm_up
+    from lib.green import make_psycopg2_green, KeepAliveWSGIHandler, pool_size, watch_hub
+
+    make_psycopg2_green()
+    if app.config.get('GEVENT_MAX_BLOCKING_TIME'):
+        watch_hub(app.config['GEVENT_MAX_BLOCKING_TIME'], app.logger)
+    warm_up(app)
+
+    class Handler(KeepAliveWSGIHandler):
+        keepalive_timeout = app.config.get('GEVENT_KEEPALIVE_TIMEOUT')
+
+    if sock is not None:
+        listener, backlog = sock, None
+    else:
+        listener, backlog = ('', port), app.config.get('GEVENT_BACKLOG')
+    http_server = WSGIServer(listener, app, backlog=backlog, spawn=Pool(pool_size(app.config)),
+                             handler_class=Handler)
+    signal_handler = getattr(gevent, 'signal_handler', None) or gevent.signal
+    signal_handler(signal.SIGTERM, http_server.stop, app.config.get('GRACEFUL_TIMEOUT', 30))
     http_server.serve_forever()
 
 if __name__ == '__main__':
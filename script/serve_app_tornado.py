@@ -1,13 +1,44 @@
 
-def run_server(app, port=8080):
+def run_server(app, port=8080, sock=None):
+    """
+    Serves `app` on `port`, or on the already listening socket `sock`.
+    With `TORNADO_THREADS` set, requests run on a thread pool of that size
+    (see :mod:`lib.tornado_pool`). When run in the main thread, SIGTERM
+    stops accepting connections, waits for pending requests and stops the
+    IOLoop.
+    """
+    import signal
+    import threading
     from tornado.wsgi import WSGIContainer
     from tornado.httpserver import HTTPServer
     from tornado.ioloop import IOLoop
+    from lib.db import warm_up
 
+    warm_up(app)
     # Initialize app and serve.
-    http_server = HTTPServer(WSGIContainer(app))
-    http_server.listen(port)
-    IOLoop.instance().start()
+    threads = app.config.get('TORNADO_THREADS')
+    if threads:
+        from lib.tornado_pool import ThreadPoolWSGIContainer
+        container = ThreadPoolWSGIContainer(app, threads, app.config.get('TORNADO_QUEUE_SIZE', 0))
+    else:
+        container = WSGIContainer(app)
+    http_server = HTTPServer(container)
+    if sock is not None:
+        http_server.add_sockets([sock])
+    else:
+        http_server.listen(port)
+    loop = IOLoop.instance()
+
+    def shutdown():
+        http_server.stop()
+        if threads:
+            container.drain(app.config.get('GRACEFUL_TIMEOUT', 30), loop.stop)
+        else:
+            loop.add_callback(loop.stop)
+    if threading.current_thread() is threading.main_thread():
+        # Not under the dev reloader, which serves from another thread.
+        signal.signal(signal.SIGTERM, lambda signum, frame: loop.add_callback_from_signal(shutdown))
+    loop.start()
 
 if __name__ == '__main__':
     import main
@@ -15,6 +15,8 @@ requirements = [
     'Flask-Assets',
     'Flask-Script',
     'Flask-Bcrypt',
+    # Flask signals, used by `lib.middlewares.MetricsMiddleware`.
+    'blinker',
 
     # Misc 3rd party
     'augment==0.4',
@@ -35,6 +37,7 @@ if not environ or environ == 'dev':
         'pylint',
         'ipython',
         'ipdb',
+        'nose',
         'gevent'
         ]
 
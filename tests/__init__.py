@@ -0,0 +1,50 @@
+"""
+Test suite, run with `flask test`. The app is set up with
+`config.test_settings`.
+"""
+import os
+import unittest
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Before anything imports `config.settings`.
+os.environ['FLASK_ENV'] = 'test'
+
+
+class AppTestCase(unittest.TestCase):
+    """
+    Creates the tables before each test and drops them after it.
+    """
+    def setUp(self):
+        import main
+        from config import db
+        self.app = main.app
+        self.db = db
+        self.context = self.app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.db.session.remove()
+        self.db.drop_all()
+        self.context.pop()
+
+    @contextmanager
+    def count_queries(self):
+        """
+        Counts the SQL statements run in the block, in a list with one
+        item.
+        """
+        count = [0]
+
+        def before_cursor_execute(*args):
+            count[0] += 1
+        engine = self.db.get_engine(self.app)
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield count
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,60 @@
+import gzip
+import unittest
+
+from werkzeug.wsgi import FileWrapper
+
+from lib.middlewares import CompressionMiddleware
+
+BODY = b'<p>Some text</p>' * 200
+
+
+class CompressionMiddlewareTest(unittest.TestCase):
+    def call(self, headers, body=(BODY,), environ=None, accept='gzip'):
+        def app(environ, start_response):
+            start_response('200 OK', headers)
+            return body
+        sent = []
+        environ = dict(environ or {}, REQUEST_METHOD='GET', HTTP_ACCEPT_ENCODING=accept)
+        app_iter = CompressionMiddleware(app, level=6, min_size=1024, brotli_quality=4)(
+            environ, lambda status, headers: sent.append(headers))
+        data = b''.join(app_iter)
+        return app_iter, dict(sent[0]), sent[0], data
+
+    def test_compresses_html(self):
+        app_iter, headers, header_list, data = self.call(
+            [('Content-Type', 'text/html'), ('Accept-Ranges', 'bytes'),
+             ('Vary', 'Cookie'), ('Vary', 'accept-encoding')], body=[BODY[:100], BODY[100:]])
+        self.assertEqual(gzip.decompress(data), BODY)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Accept-Ranges', headers)
+        self.assertEqual([v for k, v in header_list if k == 'Vary'], ['Cookie, accept-encoding'])
+
+    def test_passes_small_bodies_through(self):
+        body = [b'small']
+        app_iter, headers, header_list, data = self.call([('Content-Type', 'text/html'),
+                                                          ('Content-Length', '5')], body=body)
+        self.assertIs(app_iter, body)
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_passes_x_sendfile_through(self):
+        body = []
+        app_iter, headers, header_list, data = self.call(
+            [('Content-Type', 'text/css'), ('X-Sendfile', '/srv/static/site.css')], body=body)
+        self.assertIs(app_iter, body)
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_passes_encoded_responses_through(self):
+        body = [gzip.compress(BODY)]
+        app_iter, headers, header_list, data = self.call(
+            [('Content-Type', 'text/css'), ('Content-Encoding', 'gzip')], body=body,
+            accept='deflate')
+        self.assertIs(app_iter, body)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+
+    def test_passes_file_wrappers_through(self):
+        import io
+        body = FileWrapper(io.BytesIO(BODY))
+        app_iter, headers, header_list, data = self.call(
+            [('Content-Type', 'text/css')], body=body, environ={'wsgi.file_wrapper': FileWrapper})
+        self.assertIs(app_iter, body)
+        self.assertEqual(data, BODY)
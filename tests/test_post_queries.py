@@ -0,0 +1,45 @@
+from tests import AppTestCase
+
+
+class PostQueriesTest(AppTestCase):
+    """
+    The post pages run the same number of queries however many posts and
+    comments are shown.
+    """
+    def add_posts(self, count):
+        from blueprints.post.models import Post
+        posts = [Post('name%s' % i, 'title%s' % i, 'content %s' % i) for i in range(count)]
+        self.db.session.add_all(posts)
+        self.db.session.commit()
+        return [post.id for post in posts]
+
+    def add_comments(self, post_id, count):
+        from blueprints.post.models import insert_comments
+        insert_comments([dict(commenter='commenter%s' % i, body='comment %s' % i, post_id=post_id)
+                         for i in range(count)])
+
+    def get_queries(self, url):
+        # Nothing loaded by the test is reused by the request.
+        self.db.session.remove()
+        with self.count_queries() as count:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return count[0]
+
+    def test_post_index(self):
+        self.add_posts(1)
+        queries = self.get_queries('/posts/')
+        self.add_posts(9)
+        self.assertEqual(self.get_queries('/posts/'), queries)
+        self.add_posts(40)
+        self.assertEqual(self.get_queries('/posts/'), queries)
+        self.assertEqual(self.get_queries('/posts/?after=20'), queries)
+
+    def test_post_show(self):
+        post_id, = self.add_posts(1)
+        url = '/posts/%s' % post_id
+        queries = self.get_queries(url)
+        self.add_comments(post_id, 1)
+        self.assertEqual(self.get_queries(url), queries)
+        self.add_comments(post_id, 50)
+        self.assertEqual(self.get_queries(url), queries)
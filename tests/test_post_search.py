@@ -0,0 +1,49 @@
+from tests import AppTestCase
+
+
+class PostSearchTest(AppTestCase):
+    """
+    The search index follows post and comment writes.
+    """
+    def setUp(self):
+        super(PostSearchTest, self).setUp()
+        from blueprints.post import models, search
+        self.models = models
+        self.search = search
+        posts = [models.Post('name%s' % i, 'title%s' % i, 'content %s' % i) for i in range(3)]
+        self.db.session.add_all(posts)
+        self.db.session.commit()
+        self.post_ids = [post.id for post in posts]
+
+    def found(self, q):
+        return [post.id for post in self.search.search_posts(q).items]
+
+    def test_comments(self):
+        first = self.models.Comment('commenter', 'walrus here', self.post_ids[0])
+        second = self.models.Comment('commenter', 'another walrus', self.post_ids[1])
+        self.db.session.add_all([first, second])
+        self.db.session.commit()
+        self.assertEqual(sorted(self.found('walrus')), self.post_ids[:2])
+        first.body = 'penguin'
+        self.db.session.delete(second)
+        self.db.session.commit()
+        self.assertEqual(self.found('walrus'), [])
+        self.assertEqual(self.found('peng'), [self.post_ids[0]])
+
+    def test_title_ranks_first(self):
+        self.db.session.add(self.models.Comment('commenter', 'title2', self.post_ids[0]))
+        self.db.session.commit()
+        self.assertEqual(self.found('title2'), [self.post_ids[2], self.post_ids[0]])
+
+    def test_cursor(self):
+        self.db.session.add_all([self.models.Comment('commenter', 'shared words', post_id)
+                                 for post_id in self.post_ids for _ in range(2)])
+        self.db.session.commit()
+        found, after = [], None
+        while True:
+            page = self.search.search_posts('shared', after=after, per_page=1)
+            found.extend(post.id for post in page.items)
+            after = page.next_cursor
+            if after is None:
+                break
+        self.assertEqual(sorted(found), self.post_ids)
@@ -0,0 +1,33 @@
+from tests import AppTestCase
+
+
+class PostVersionTest(AppTestCase):
+    """
+    `version` changes with every write to a post or its comments, and
+    concurrent writes don't fail on it.
+    """
+    def setUp(self):
+        super(PostVersionTest, self).setUp()
+        from blueprints.post.models import Post
+        self.Post = Post
+        post = Post('name', 'title', 'content')
+        self.db.session.add(post)
+        self.db.session.commit()
+        self.post_id = post.id
+
+    def test_edit_bumps_version(self):
+        post = self.Post.query.get(self.post_id)
+        post.title = 'edited'
+        self.db.session.commit()
+        self.assertEqual(post.version, 2)
+
+    def test_edit_after_concurrent_comment(self):
+        post = self.Post.query.get(self.post_id)
+        # A comment committed by another request while the post is edited.
+        with self.db.get_engine(self.app).begin() as conn:
+            conn.execute(self.Post.__table__.update().values(version=self.Post.version + 1))
+        post.title = 'edited'
+        self.db.session.commit()
+        self.assertEqual(post.version, 3)
+        self.db.session.delete(post)
+        self.db.session.commit()
@@ -0,0 +1,45 @@
+from werkzeug.contrib.cache import SimpleCache
+
+import config
+from lib.response_cache import cache_response, tag_response, invalidate
+from tests import AppTestCase
+
+
+class ResponseCacheTest(AppTestCase):
+    def setUp(self):
+        super(ResponseCacheTest, self).setUp()
+        self.cache, config.cache = config.cache, SimpleCache()
+        self.renders = []
+
+    def tearDown(self):
+        config.cache = self.cache
+        super(ResponseCacheTest, self).tearDown()
+
+    def get(self, view):
+        with self.app.test_request_context('/'):
+            return view().get_data(as_text=True)
+
+    def test_cached_until_invalidated(self):
+        @cache_response(tags=['list'])
+        def view():
+            tag_response('row:1')
+            self.renders.append(1)
+            return 'page %s' % len(self.renders)
+        self.assertEqual(self.get(view), 'page 1')
+        self.assertEqual(self.get(view), 'page 1')
+        with self.app.test_request_context('/'):
+            invalidate('row:1')
+        self.assertEqual(self.get(view), 'page 2')
+
+    def test_not_cached_when_invalidated_while_rendering(self):
+        @cache_response(tags=['list'])
+        def view():
+            tag_response('row:1')
+            self.renders.append(1)
+            if len(self.renders) == 1:
+                # A write committed after the rows were read.
+                invalidate('row:1')
+            return 'page %s' % len(self.renders)
+        self.assertEqual(self.get(view), 'page 1')
+        self.assertEqual(self.get(view), 'page 2')
+        self.assertEqual(self.get(view), 'page 2')
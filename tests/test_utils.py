@@ -0,0 +1,32 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from lib.utils import private_directory
+
+
+class PrivateDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.parent = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.parent)
+
+    def test_creates_with_mode_0700(self):
+        path = private_directory(os.path.join(self.parent, 'cache'))
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+        self.assertEqual(private_directory(path), path)
+
+    def test_rejects_writable_by_others(self):
+        path = os.path.join(self.parent, 'cache')
+        os.mkdir(path)
+        os.chmod(path, 0o777)
+        self.assertRaises(RuntimeError, private_directory, path)
+
+    def test_rejects_symlinks(self):
+        os.mkdir(os.path.join(self.parent, 'target'), 0o700)
+        path = os.path.join(self.parent, 'cache')
+        os.symlink(os.path.join(self.parent, 'target'), path)
+        self.assertRaises(RuntimeError, private_directory, path)